@@ -39,6 +39,10 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'main.CustomUser'
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'main.metrics.MetricsMiddleware',
+    # Before anything that reads or changes the response body
+    'main.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,7 +57,7 @@ MIDDLEWARE = [
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://localhost:3000",
-    'http://localhost:8081'  
+    'http://localhost:8081',
     'http://localhost:8080'  
 ]
 
@@ -74,13 +78,52 @@ CORS_ALLOW_METHODS = [
     'OPTIONS',
 ]
 
+try:
+    import msgpack  # noqa: F401
+    _MSGPACK_AVAILABLE = True
+except ImportError:
+    _MSGPACK_AVAILABLE = False
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Bearer JWTs, authenticated from their claims without a user query
+        'main.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # Opt-in: only applies when the client sends ?page_size= or ?cursor=
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    # MessagePack (Accept / Content-Type: application/msgpack) when msgpack is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['main.renderers.MessagePackRenderer'] if _MSGPACK_AVAILABLE else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['main.renderers.MessagePackParser'] if _MSGPACK_AVAILABLE else []),
 }
 
+# Responses smaller than this go out uncompressed (main.compression)
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11; higher is smaller but much slower to encode
+
+
+# main.authentication.ClaimsJWTAuthentication keeps validated tokens in memory
+# for this many seconds (never past their expiry)
+JWT_AUTH_CACHE_TTL = 60
+JWT_AUTH_CACHE_SIZE = 10000
+
+SIMPLE_JWT = {
+    # Refresh checks the in-memory blacklist (main.blacklist) instead of querying it
+    'TOKEN_REFRESH_SERIALIZER': 'main.serializers.CachedTokenRefreshSerializer',
+}
+# How often each process picks up tokens blacklisted by other processes
+JWT_BLACKLIST_SYNC_INTERVAL = 5
+# ...re-reading this many ids behind the last one seen, for late commits
+JWT_BLACKLIST_SYNC_OVERLAP = 100
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -106,14 +149,142 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_PROFILE=production keeps SQLite but turns on WAL, relaxed fsync, mmap and
+# a busy timeout on every new connection, takes the write lock at BEGIN (so
+# concurrent writers wait instead of failing with "database is locked") and
+# keeps connections open between requests.
+# DB_ENGINE=postgresql switches to PostgreSQL with a psycopg connection pool
+# (needs psycopg[pool]), configured from the POSTGRES_* variables.
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'  # 256 MB
+        'PRAGMA cache_size=-65536;'  # 64 MB
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA busy_timeout=5000;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 5,
+}
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'farm'),
+            'USER': os.environ.get('POSTGRES_USER', 'farm'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # The pool replaces persistent connections, so CONN_MAX_AGE stays 0
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 20)),
+                    'timeout': 10,
+                },
+            },
+        }
     }
+elif DB_PROFILE == 'production':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+
+# Caches
+# main.cache stores serialized API payloads in the 'api' alias: an in-process
+# LRU by default, or a Redis-compatible server when API_CACHE_REDIS_URL is set
+# (needs the redis package).
+
+API_CACHE_REDIS_URL = os.environ.get('API_CACHE_REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': API_CACHE_REDIS_URL,
+    } if API_CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+API_CACHE_ENABLED = os.environ.get('API_CACHE_ENABLED', '1') != '0'
+API_CACHE_ALIAS = 'api'
+API_CACHE_TTLS = {  # Seconds, per endpoint
+    'farm-types': 3600,
+    'crops': 600,
+    'farmers': 60,
 }
 
 
+# Request metrics (main.metrics), served in Prometheus format at /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # If set, scrapers must send "Authorization: Bearer <token>"
+# Opt-in slow query log on the main.slow_queries logger: queries slower than
+# SLOW_QUERY_MS are logged, a SLOW_QUERY_STACK_SAMPLE_RATE share with a stack trace
+SLOW_QUERY_MS = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+SLOW_QUERY_STACK_SAMPLE_RATE = 0.1
+
+# Password hashing profile. 'argon2' (the default when argon2-cffi is
+# installed) hashes with main.hashers.TunedArgon2PasswordHasher; 'pbkdf2' is
+# Django's stock list. Both profiles can still verify each other's hashes and
+# upgrade them to the preferred hasher on the next login.
+try:
+    import argon2  # noqa: F401
+    _ARGON2_AVAILABLE = True
+except ImportError:
+    _ARGON2_AVAILABLE = False
+
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'argon2' if _ARGON2_AVAILABLE else 'pbkdf2')
+_PBKDF2_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+_ARGON2_HASHERS = ['main.hashers.TunedArgon2PasswordHasher'] if _ARGON2_AVAILABLE else []
+PASSWORD_HASHER_PROFILES = {
+    'argon2': _ARGON2_HASHERS + _PBKDF2_HASHERS,
+    'pbkdf2': _PBKDF2_HASHERS + _ARGON2_HASHERS,
+}
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+# Argon2id costs (memory in KiB); changing them upgrades hashes on next login
+PASSWORD_ARGON2 = {
+    'time_cost': int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2)),
+    'memory_cost': int(os.environ.get('PASSWORD_ARGON2_MEMORY_KIB', 19456)),
+    'parallelism': 1,
+}
+# Password checks/hashes running at once per process (main.hashers.hashing_slot).
+# Up to PASSWORD_HASH_QUEUE more requests wait PASSWORD_HASH_WAIT seconds for a
+# slot; anything beyond that gets a 503 so it doesn't hold a server thread
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+PASSWORD_HASH_WAIT = 5
+PASSWORD_REHASH_ASYNC = True  # False upgrades hashes inline, e.g. in tests
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -158,7 +329,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Media files (user-uploaded files)
 MEDIA_URL = '/media/'  # URL to access media files
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Directory to store media files on the server
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))  # Directory to store media files on the server
+MEDIA_LEGACY_MAX_AGE = 3600  # Cache lifetime for media saved before content addressing
+
+# Uploads are stored once per distinct content, named by their sha256
+# (main.storage), and served with immutable caching and Range support (main.media)
+STORAGES = {
+    'default': {'BACKEND': 'main.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 # Static files (CSS, JavaScript, etc.)
 STATIC_URL = '/static/'  # URL to access static files
@@ -167,4 +346,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')  # Directory to collect static fi
 # Static file directories where Django looks for additional static files (e.g., in development)
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'staticfiles'),  # Add custom static files if you have any
-]
\ No newline at end of file
+]
+
+# Delta sync (/api/sync/): change ids behind the client's cursor each sync
+# reads again, as a slow transaction can commit a lower id after a higher one
+SYNC_CURSOR_OVERLAP = 100
+
+# Bulk farmer upsert (/api/farmers/bulk/)
+FARMER_BULK_MAX_ROWS = 10000  # Rows accepted per request
+FARMER_BULK_CHUNK_SIZE = 500  # Rows written per transaction
+
+# Farmer duplicate detection (main.duplicates): scores run from 0 to 1
+FARMER_SIMILAR_MIN_SCORE = 0.6  # Lowest score /api/farmers/similar/ returns
+FARMER_DUPLICATE_SCORE = 0.85  # Creates/edits this close to an existing farmer need allow_duplicate
+FARMER_SIMILAR_CANDIDATES = 50  # Rows taken from the trigram index before scoring
+FARMER_SIMILAR_SCAN = 500  # Index matches ranked per field to pick those; bounds the lookup cost
+
+# Crop image variants (main.images): generated by the task queue workers
+CROP_IMAGE_ASYNC = True  # False processes inline, e.g. in tests
+CROP_IMAGE_MAX_BYTES = 10 * 1024 * 1024  # Largest accepted crop image upload
+
+# Background tasks (main.tasks) live in the database and are run by
+# `manage.py run_workers`. A task running longer than this is assumed to have
+# lost its worker and is picked up again.
+TASK_LEASE_SECONDS = 300
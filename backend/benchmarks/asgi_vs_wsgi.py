@@ -0,0 +1,62 @@
+"""Compare the sync API under WSGI (gunicorn) with /api/async/ under ASGI (uvicorn).
+
+Needs gunicorn and uvicorn installed. Run from the backend directory:
+
+    python -m benchmarks.asgi_vs_wsgi --farmers 20000 --concurrency 200 --slow-send 0.5
+
+``--slow-send`` makes every client hold its socket open that long before the
+request is complete, like a phone on a 2G link. The sync deployment needs a
+thread per such socket; the async one does not.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from . import seed
+from .loadgen import free_port, print_table, run_load, run_server
+
+ENDPOINTS = [
+    ('farmers page', '/api/farmers/?page_size=50', '/api/async/farmers/?page_size=50'),
+    ('farmer detail', '/api/farmers/1/', '/api/async/farmers/1/'),
+    ('crops', '/api/crops/', '/api/async/crops/'),
+    ('stats', '/api/stats/', '/api/async/stats/'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--farmers', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--slow-send', type=float, default=0.0, help="Seconds each client stalls mid-request")
+    parser.add_argument('--workers', type=int, default=2, help="Server processes for both deployments")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'bench.sqlite3'
+        seed.configure(db_path)
+        print(f"Seeded {seed.seed(args.farmers)} farmers")
+        env = {**seed.benchmark_env(db_path), 'API_CACHE_ENABLED': '0'}
+
+        deployments = [
+            ('wsgi', ['gunicorn', 'backend.wsgi:application', '--bind', '127.0.0.1:{port}',
+                      '--workers', str(args.workers), '--threads', str(args.threads), '--worker-class', 'gthread']),
+            ('asgi', ['uvicorn', 'backend.asgi:application', '--port', '{port}',
+                      '--workers', str(args.workers), '--log-level', 'warning']),
+        ]
+        rows = []
+        for deployment, command in deployments:
+            with run_server(command, free_port(), env) as base_url:
+                for label, sync_path, async_path in ENDPOINTS:
+                    path = sync_path if deployment == 'wsgi' else async_path
+                    run_load(base_url, path, concurrency=4, requests=20)  # warm up
+                    result = run_load(base_url, path, concurrency=args.concurrency,
+                                      requests=args.requests, slow_send=args.slow_send)
+                    rows.append({'deployment': deployment, 'endpoint': label, **result.summary()})
+
+        print_table(rows, ['deployment', 'endpoint', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Small stdlib load generator and server launcher shared by the benchmarks."""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start within {timeout}s")
+
+
+@contextmanager
+def run_server(command, port, env=None):
+    """Run ``command`` (a list, may contain {port}) from the backend directory."""
+    command = [part.format(port=port) for part in command]
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        wait_for_port(port)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class LoadResult:
+    def __init__(self, latencies, errors, elapsed, bytes_received):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.bytes_received = bytes_received
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return float('nan')
+        index = min(len(self.latencies) - 1, int(round(pct / 100 * (len(self.latencies) - 1))))
+        return self.latencies[index]
+
+    def summary(self):
+        return {
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'rps': round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50_ms': round(self.percentile(50) * 1000, 1),
+            'p95_ms': round(self.percentile(95) * 1000, 1),
+            'p99_ms': round(self.percentile(99) * 1000, 1),
+            'mean_ms': round(statistics.fmean(self.latencies) * 1000, 1) if self.latencies else float('nan'),
+            'bytes_per_request': round(self.bytes_received / len(self.latencies)) if self.latencies else 0,
+        }
+
+
+def _request(base_url, method, path, body, headers, slow_send):
+    host_port = base_url.split('://', 1)[1]
+    conn = http.client.HTTPConnection(host_port, timeout=120)
+    try:
+        if slow_send:
+            # Dribble the request out like a phone on a weak link: the server
+            # has the socket open for slow_send seconds before it can respond.
+            conn.putrequest(method, path)
+            for name, value in (headers or {}).items():
+                conn.putheader(name, value)
+            if body is not None:
+                conn.putheader('Content-Length', str(len(body)))
+            conn.endheaders()
+            time.sleep(slow_send)
+            if body is not None:
+                conn.send(body)
+        else:
+            conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        payload = response.read()
+        return response.status, len(payload)
+    finally:
+        conn.close()
+
+
+def run_load(base_url, path, concurrency=10, requests=200, method='GET', body=None,
+             headers=None, slow_send=0.0, ok_statuses=(200,)):
+    """Fire ``requests`` requests from ``concurrency`` client threads."""
+    latencies, errors, received = [], [0], [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status, size = _request(base_url, method, path, body, headers, slow_send)
+            except OSError:
+                status, size = None, 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status in ok_statuses:
+                    latencies.append(elapsed)
+                    received[0] += size
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return LoadResult(latencies, errors[0], time.perf_counter() - started, received[0])
+
+
+def print_table(rows, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column, ''))) for row in rows)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row.get(column, '')).ljust(widths[column]) for column in columns))
+    sys.stdout.flush()
@@ -0,0 +1,78 @@
+"""Login throughput per password-hashing profile, and what a login burst does to the rest of the API.
+
+Needs gunicorn installed. Run from the backend directory:
+
+    python -m benchmarks.login --concurrency 100 --requests 500 --hash-concurrency 2
+
+For each profile the benchmark stores the clerk's password with that
+profile's hasher, starts gunicorn with PASSWORD_HASHER_PROFILE set, then fires
+a burst of /api/token/ logins while a second client keeps reading
+/api/farm-types/. The farm-types latency shows whether hashing is starving
+the API workers.
+"""
+import argparse
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+from . import seed
+from .loadgen import free_port, print_table, run_load, run_server
+
+PROFILES = [('pbkdf2', 'pbkdf2_sha256'), ('argon2', 'argon2')]
+USERNAME, PASSWORD = 'bench-clerk', 'bench-pass-123'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=50, help="Clients logging in at once")
+    parser.add_argument('--requests', type=int, default=300, help="Logins per profile")
+    parser.add_argument('--hash-concurrency', type=int, default=2, help="PASSWORD_HASH_CONCURRENCY for the server")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    body = json.dumps({'username': USERNAME, 'password': PASSWORD}).encode()
+    headers = {'Content-Type': 'application/json'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'bench.sqlite3'
+        seed.configure(db_path)
+        seed.seed(0)
+        rows = []
+        for profile, hasher in PROFILES:
+            seed.seed_clerk(USERNAME, PASSWORD, hasher)
+            env = {
+                **seed.benchmark_env(db_path),
+                'API_CACHE_ENABLED': '0',
+                'PASSWORD_HASHER_PROFILE': profile,
+                'PASSWORD_HASH_CONCURRENCY': str(args.hash_concurrency),
+            }
+            command = ['gunicorn', 'backend.wsgi:application', '--bind', '127.0.0.1:{port}',
+                       '--workers', str(args.workers), '--threads', str(args.threads),
+                       '--worker-class', 'gthread']
+            with run_server(command, free_port(), env) as base_url:
+                run_load(base_url, '/api/token/', concurrency=2, requests=4, method='POST',
+                         body=body, headers=headers)  # warm up (and upgrade the hash)
+                idle = run_load(base_url, '/api/farm-types/', concurrency=4, requests=200)
+
+                reads = {}
+
+                def read_during_burst():
+                    reads['result'] = run_load(base_url, '/api/farm-types/', concurrency=4, requests=200)
+
+                reader = threading.Thread(target=read_during_burst)
+                reader.start()
+                logins = run_load(base_url, '/api/token/', concurrency=args.concurrency,
+                                  requests=args.requests, method='POST', body=body, headers=headers)
+                reader.join()
+
+            rows.append({'profile': profile, 'load': 'login burst', **logins.summary()})
+            rows.append({'profile': profile, 'load': 'farm-types idle', **idle.summary()})
+            rows.append({'profile': profile, 'load': 'farm-types in burst', **reads['result'].summary()})
+
+        print_table(rows, ['profile', 'load', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
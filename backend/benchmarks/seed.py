@@ -0,0 +1,80 @@
+"""Synthetic registry generator for the benchmarks.
+
+Call ``configure(db_path)`` before anything imports Django models: it points
+the production SQLite profile at a throwaway database file.
+"""
+import os
+import random
+from pathlib import Path
+
+FARM_TYPES = ['Commercial', 'Communal', 'Resettlement', 'Small-scale', 'Peri-urban', 'Estate']
+CROPS = ['Maize', 'Tobacco', 'Wheat', 'Cotton', 'Sorghum', 'Soya beans', 'Groundnuts', 'Sugar beans',
+         'Coffee', 'Tea', 'Potatoes', 'Sunflower']
+LOCATIONS = ['Harare', 'Bulawayo', 'Mutare', 'Gweru', 'Kwekwe', 'Chinhoyi', 'Masvingo', 'Kadoma',
+             'Marondera', 'Zvishavane', 'Victoria Falls', 'Kariba', 'Bindura', 'Chipinge']
+FIRST_NAMES = ['Tendai', 'Rudo', 'Farai', 'Tatenda', 'Nyasha', 'Chipo', 'Tinashe', 'Kudzai', 'Blessing',
+               'Tafadzwa', 'Rumbidzai', 'Simba']
+LAST_NAMES = ['Moyo', 'Ncube', 'Sibanda', 'Dube', 'Nyathi', 'Chikomo', 'Mutasa', 'Mhlanga', 'Ndlovu',
+              'Chirwa', 'Mapfumo', 'Zhou']
+
+
+def benchmark_env(db_path):
+    return {
+        'DJANGO_SETTINGS_MODULE': 'backend.settings',
+        'DB_PROFILE': 'production',
+        'SQLITE_PATH': str(db_path),
+        # Uploads go next to the throwaway database, never into backend/media
+        'MEDIA_ROOT': str(Path(db_path).parent / 'media'),
+    }
+
+
+def configure(db_path):
+    os.environ.update(benchmark_env(db_path))
+    import django
+    django.setup()
+
+
+def seed(farmers, chunk_size=5000, rng_seed=42):
+    """Create the reference tables and ``farmers`` synthetic farmers."""
+    from django.core.management import call_command
+
+    from main.locations import resolve_locations
+    from main.models import Crop, Farmer, FarmType
+    from main.stats import rebuild_farmer_stats
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(rng_seed)
+
+    farm_types = [FarmType.objects.get_or_create(name=name, defaults={'description': f'{name} farms'})[0]
+                  for name in FARM_TYPES]
+    crops = [Crop.objects.get_or_create(name=name, defaults={'description': f'{name} crop'})[0]
+             for name in CROPS]
+
+    locations = resolve_locations(LOCATIONS)
+    existing = Farmer.objects.count()
+    for start in range(existing, farmers, chunk_size):
+        Farmer.objects.bulk_create([
+            Farmer(
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                national_id=f'{i % 90 + 10:02d}-{i:07d}{chr(65 + i % 26)}{i % 90 + 10:02d}',
+                location=(location := rng.choice(LOCATIONS)),
+                location_ref_id=locations[location][0],
+                farm_type=rng.choice(farm_types),
+                crop=rng.choice(crops),
+            )
+            for i in range(start, min(start + chunk_size, farmers))
+        ])
+    rebuild_farmer_stats()
+    return Farmer.objects.count()
+
+
+def seed_clerk(username, password, hasher=None):
+    """Create (or reset) a clerk account; ``hasher`` picks the stored hash format."""
+    from django.contrib.auth.hashers import make_password
+
+    from main.models import CustomUser
+
+    user, _ = CustomUser.objects.get_or_create(username=username, defaults={'role': 'clerk'})
+    user.password = make_password(password, hasher=hasher or 'default')
+    user.save(update_fields=['password'])
+    return user
@@ -0,0 +1,183 @@
+"""Benchmark suite for the REST API with stored baselines.
+
+Needs gunicorn installed. Run from the backend directory:
+
+    python -m benchmarks.suite --farmers 10000                    # compare with baselines.json
+    python -m benchmarks.suite --farmers 10000 --update-baseline  # record new baselines
+    python -m benchmarks.suite --farmers 1000000 --db /tmp/bench-1m.sqlite3
+    python -m benchmarks.suite --farmers 200000 --scenario farmer-similar  # duplicate lookups
+
+Seeds a synthetic registry (reused when --db points at an existing file),
+starts gunicorn with one worker so its /metrics covers every request, and
+drives each scenario with concurrent clients. Queries per request come from
+the server's own metrics (main.metrics).
+
+Each result is compared with the baseline stored for the same farmer count.
+The run fails (exit status 1) if any of these happen:
+- a scenario runs more queries per request than its baseline
+- throughput drops, or p95 latency rises, by more than --tolerance
+- it has more errors than its baseline
+
+Throughput and latency baselines only mean something on the machine that
+recorded them, so re-record them (--update-baseline) when the hardware
+changes. Query counts hold anywhere.
+"""
+import argparse
+import io
+import json
+import re
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+from . import seed
+from .loadgen import free_port, print_table, run_load, run_server
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines.json'
+USERNAME, PASSWORD = 'bench-clerk', 'bench-pass-123'
+
+# name -> how to drive it; ``route`` is the URL name main.metrics labels it with
+SCENARIOS = {
+    'farmers-page': {'route': 'farmer-list', 'path': '/api/farmers/?page_size=100'},
+    'farmers-filtered': {'route': 'farmer-list', 'path': '/api/farmers/?location=Harare&page_size=50'},
+    'farmer-detail': {'route': 'farmer-detail', 'path': '/api/farmers/1/'},
+    'crops': {'route': 'crop-list', 'path': '/api/crops/'},
+    # A clerk's typos in both fields, as the registration form looks them up
+    'farmer-similar': {'route': 'farmer-similar',
+                       'path': '/api/farmers/similar/?name=Tendayi%20Moyo&national_id=25-0012354V25'},
+    # Hashing dominates logins and uploads, so they get a tenth of the requests.
+    # Logins beyond the server's hashing slots and queue get a 503 by design
+    # (see main.hashers), so they run at most 4 at a time.
+    'login': {'route': 'token_obtain_pair', 'path': '/api/token/', 'method': 'POST', 'share': 0.1,
+              'concurrency': 4},
+    'crop-image-upload': {'route': 'crop-image', 'path': '/api/crops/1/image/', 'method': 'PUT', 'share': 0.1},
+}
+
+_METRIC_LINE = re.compile(r'^db_queries_per_request_(sum|count)\{route="([^"]*)",method="([^"]*)"\} (\S+)$')
+
+
+def query_totals(base_url):
+    """{(route, method): [query sum, request count]} from the server's /metrics."""
+    with urllib.request.urlopen(f'{base_url}/metrics') as response:
+        text = response.read().decode()
+    totals = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            kind, route, method, value = match.groups()
+            totals.setdefault((route, method), [0.0, 0.0])[kind == 'count'] = float(value)
+    return totals
+
+
+def request_body(name):
+    if name == 'login':
+        return json.dumps({'username': USERNAME, 'password': PASSWORD}).encode(), {'Content-Type': 'application/json'}
+    if name == 'crop-image-upload':
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), (40, 160, 60)).save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue(), {
+            'Content-Type': 'image/jpeg',
+            'Content-Disposition': 'attachment; filename=bench.jpg',
+        }
+    return None, {}
+
+
+def run_scenario(base_url, name, concurrency, requests):
+    scenario = SCENARIOS[name]
+    method = scenario.get('method', 'GET')
+    body, headers = request_body(name)
+    concurrency = min(concurrency, scenario.get('concurrency', concurrency))
+    requests = max(concurrency, int(requests * scenario.get('share', 1)))
+
+    run_load(base_url, scenario['path'], concurrency=2, requests=4, method=method, body=body, headers=headers)
+    before = query_totals(base_url).get((scenario['route'], method), [0.0, 0.0])
+    result = run_load(base_url, scenario['path'], concurrency=concurrency, requests=requests,
+                      method=method, body=body, headers=headers)
+    after = query_totals(base_url).get((scenario['route'], method), [0.0, 0.0])
+
+    handled = after[1] - before[1]
+    queries = round((after[0] - before[0]) / handled, 2) if handled else 0.0
+    return {**result.summary(), 'queries_per_request': queries}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions of ``results`` against ``baseline``."""
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries_per_request'] > base['queries_per_request']:
+            failures.append(f"{name}: {result['queries_per_request']} queries/request, "
+                            f"baseline {base['queries_per_request']}")
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            failures.append(f"{name}: {result['rps']} req/s, baseline {base['rps']}")
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            failures.append(f"{name}: p95 {result['p95_ms']} ms, baseline {base['p95_ms']} ms")
+        if result['errors'] > base['errors']:
+            failures.append(f"{name}: {result['errors']} errors, baseline {base['errors']}")
+    return failures
+
+
+def load_baselines(path=BASELINE_PATH):
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--farmers', type=int, default=10000, help="Farmers to seed (10^3 to 10^6)")
+    parser.add_argument('--db', help="SQLite file to seed and reuse across runs (default: a temporary file)")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000, help="Requests per read scenario")
+    parser.add_argument('--threads', type=int, default=16, help="gunicorn threads")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Run only these scenarios (repeatable)")
+    parser.add_argument('--with-cache', action='store_true',
+                        help="Leave the response cache on (off by default so reads hit the database)")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed throughput/p95 regression as a fraction (default %(default)s)")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--baseline-file', type=Path, default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(args.db) if args.db else Path(tmp) / 'bench.sqlite3'
+        seed.configure(db_path)
+        print(f"Seeded {seed.seed(args.farmers)} farmers")
+        seed.seed_clerk(USERNAME, PASSWORD)
+
+        env = {**seed.benchmark_env(db_path), 'API_CACHE_ENABLED': '1' if args.with_cache else '0'}
+        command = ['gunicorn', 'backend.wsgi:application', '--bind', '127.0.0.1:{port}',
+                   '--workers', '1', '--threads', str(args.threads), '--worker-class', 'gthread']
+        results = {}
+        with run_server(command, free_port(), env) as base_url:
+            for name in args.scenario or SCENARIOS:
+                results[name] = run_scenario(base_url, name, args.concurrency, args.requests)
+
+    print_table([{'scenario': name, **result} for name, result in results.items()],
+                ['scenario', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'])
+
+    baselines = load_baselines(args.baseline_file)
+    key = f'farmers={args.farmers}'
+    if args.update_baseline:
+        baselines[key] = {**baselines.get(key, {}), **results}
+        args.baseline_file.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f"Baseline for {key} written to {args.baseline_file}")
+        return
+
+    if key not in baselines:
+        print(f"No baseline for {key}; record one with --update-baseline")
+        return
+    failures = compare(results, baselines[key], args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"No regressions against the {key} baseline")
+
+
+if __name__ == '__main__':
+    main()
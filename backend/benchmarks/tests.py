@@ -0,0 +1,21 @@
+from django.test import SimpleTestCase
+
+from .suite import compare
+
+
+class BenchmarkBaselineTests(SimpleTestCase):
+    baseline = {'farmers-page': {'rps': 100.0, 'p95_ms': 50.0, 'errors': 0, 'queries_per_request': 1.0}}
+
+    def result(self, **overrides):
+        return {'farmers-page': {**self.baseline['farmers-page'], **overrides}}
+
+    def test_within_tolerance_passes(self):
+        self.assertEqual(compare(self.result(rps=80.0, p95_ms=60.0), self.baseline, 0.25), [])
+
+    def test_regressions_fail(self):
+        failures = compare(self.result(rps=70.0, p95_ms=70.0, errors=2, queries_per_request=3.0), self.baseline, 0.25)
+        self.assertEqual(len(failures), 4)
+        self.assertIn('farmers-page: 3.0 queries/request, baseline 1.0', failures)
+
+    def test_scenarios_without_baseline_are_skipped(self):
+        self.assertEqual(compare({'login': self.baseline['farmers-page']}, self.baseline, 0.25), [])
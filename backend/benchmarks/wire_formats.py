@@ -0,0 +1,87 @@
+"""Bytes on the wire and encode time for each response format.
+
+Runs in-process (no server). From the backend directory:
+
+    python -m benchmarks.wire_formats --farmers 5000
+
+Serializes the farmer list (full and ?compact=1) and the crop list once, then
+times rendering with JSON and MessagePack, each plain, gzipped and brotli'd
+with the same settings main.compression uses.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from . import seed
+from .loadgen import print_table
+
+
+def payloads():
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    return {
+        'farmers': client.get('/api/farmers/').data,
+        'farmers compact': client.get('/api/farmers/?compact=1').data,
+        'crops': client.get('/api/crops/').data,
+    }
+
+
+def encoders():
+    from django.utils.text import compress_string
+    from rest_framework.renderers import JSONRenderer
+
+    from main.compression import brotli, brotli_compress
+    from main.renderers import MessagePackRenderer, msgpack
+
+    renderers = [('json', JSONRenderer())]
+    if msgpack is not None:
+        renderers.append(('msgpack', MessagePackRenderer()))
+    compressors = [('', None), ('+gzip', compress_string)]
+    if brotli is not None:
+        compressors.append(('+br', brotli_compress))
+
+    for renderer_name, renderer in renderers:
+        for suffix, compress in compressors:
+            def encode(data, renderer=renderer, compress=compress):
+                body = renderer.render(data)
+                return compress(body) if compress else body
+            yield renderer_name + suffix, encode
+
+
+def measure(encode, data, repeat):
+    encode(data)  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode(data)
+    return len(body), (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--farmers', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5, help="Encodes per format, averaged")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed.configure(Path(tmp) / 'bench.sqlite3')
+        from django.conf import settings
+        settings.ALLOWED_HOSTS = ['*']  # the test client talks to 'testserver'
+        print(f"Seeded {seed.seed(args.farmers)} farmers")
+
+        rows = []
+        for payload_name, data in payloads().items():
+            baseline = None
+            for format_name, encode in encoders():
+                size, seconds = measure(encode, data, args.repeat)
+                baseline = baseline or size
+                rows.append({
+                    'payload': payload_name, 'format': format_name, 'bytes': size,
+                    'vs_json': f'{size / baseline:.0%}', 'encode_ms': round(seconds * 1000, 2),
+                })
+        print_table(rows, ['payload', 'format', 'bytes', 'vs_json', 'encode_ms'])
+
+
+if __name__ == '__main__':
+    main()
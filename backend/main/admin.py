@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FarmType, Crop, Farmer, CustomUser
+from .models import FarmType, Crop, Farmer, CustomUser, Location, Task
 
 @admin.register(FarmType)
 class FarmTypeAdmin(admin.ModelAdmin):
@@ -9,10 +9,23 @@ class FarmTypeAdmin(admin.ModelAdmin):
 class CropAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'description']
 
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'latitude', 'longitude']
+    search_fields = ['name']
+    exclude = ['key', 'grid_cell']  # Derived from name and coordinates on save
+
 @admin.register(Farmer)
 class FarmerAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'national_id', 'location', 'farm_type', 'crop']
+    list_select_related = ['farm_type', 'crop']
+    readonly_fields = ['location_ref']
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
     list_display = ['id', 'username', 'email', 'role']
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'name']
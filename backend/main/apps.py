@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from . import images  # noqa: F401  (registers its queued task)
+        from .metrics import install_query_wrapper
+
+        connection_created.connect(install_query_wrapper, dispatch_uid='main.metrics.queries')
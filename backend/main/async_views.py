@@ -0,0 +1,124 @@
+"""Async (ASGI) variants of the read-heavy endpoints.
+
+Served under /api/async/. Under an ASGI server (uvicorn, daphne) these run on
+the event loop through Django's async ORM instead of taking a thread from the
+sync pool for the whole request, so many slow mobile connections can be open
+at once. Responses match the sync endpoints; paging is keyset style with
+``?page_size=`` and ``?after=<last id>``.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import APIException, ValidationError
+
+from .authentication import ClaimsJWTAuthentication
+from .filters import filter_farmers
+from .models import Crop, Farmer, FarmType
+from .pagination import KeysetPagination
+from .serializers import CropGetSerializer, FarmerGetSerializer, FarmTypeGetSerializer
+from .stats import adashboard_stats
+
+AUTHENTICATORS = (ClaimsJWTAuthentication, TokenAuthentication)
+
+
+def _error(detail, status=400):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def _list(request, queryset, serializer_class):
+    context = {'request': request}
+    page_size = request.GET.get('page_size')
+    if page_size is None:
+        rows = [obj async for obj in queryset]
+        return JsonResponse(serializer_class(rows, many=True, context=context).data, safe=False)
+
+    try:
+        page_size = min(int(page_size), KeysetPagination.max_page_size)
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return _error("page_size and after must be integers.")
+    if page_size < 1:
+        return _error("page_size must be at least 1.")
+
+    # Fetch one extra row to learn whether there is a next page
+    rows = [obj async for obj in queryset.filter(pk__gt=after).order_by('pk')[:page_size + 1]]
+    next_after = rows[page_size - 1].pk if len(rows) > page_size else None
+    return JsonResponse({
+        'next_after': next_after,
+        'results': serializer_class(rows[:page_size], many=True, context=context).data,
+    })
+
+
+async def _retrieve(request, queryset, serializer_class, pk):
+    obj = await queryset.filter(pk=pk).afirst()
+    if obj is None:
+        return _error("Not found.", status=404)
+    return JsonResponse(serializer_class(obj, context={'request': request}).data)
+
+
+@require_GET
+async def farmer_list(request):
+    try:
+        queryset = filter_farmers(Farmer.objects.select_related('farm_type', 'crop'), request.GET)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    return await _list(request, queryset, FarmerGetSerializer)
+
+
+@require_GET
+async def farmer_detail(request, pk):
+    return await _retrieve(request, Farmer.objects.select_related('farm_type', 'crop'), FarmerGetSerializer, pk)
+
+
+@require_GET
+async def crop_list(request):
+    return await _list(request, Crop.objects.all(), CropGetSerializer)
+
+
+@require_GET
+async def crop_detail(request, pk):
+    return await _retrieve(request, Crop.objects.all(), CropGetSerializer, pk)
+
+
+@require_GET
+async def farm_type_list(request):
+    return await _list(request, FarmType.objects.all(), FarmTypeGetSerializer)
+
+
+@require_GET
+async def farm_type_detail(request, pk):
+    return await _retrieve(request, FarmType.objects.all(), FarmTypeGetSerializer, pk)
+
+
+@require_GET
+async def stats(request):
+    return JsonResponse(await adashboard_stats())
+
+
+async def _authenticate(request):
+    user = await request.auser()  # session
+    if user.is_authenticated:
+        return user
+    for authenticator_class in AUTHENTICATORS:
+        result = await sync_to_async(authenticator_class().authenticate)(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+@require_http_methods(['GET', 'POST'])
+async def current_user(request):
+    try:
+        user = await _authenticate(request)
+    except APIException as e:
+        return _error(str(e.detail), status=401)
+    if user is None:
+        return _error("CustomUser not found", status=404)
+    return JsonResponse({
+        'username': user.username,
+        'email': user.email,
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    })
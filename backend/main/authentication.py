@@ -0,0 +1,113 @@
+import threading
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+# Claims added to every token at issue (see CustomTokenObtainPairSerializer)
+USER_CLAIMS = ('username', 'email', 'first_name', 'last_name', 'role', 'is_staff', 'is_superuser')
+
+
+def user_role(user):
+    role = getattr(user, 'role', None)
+    # If the role is None, determine it based on whether the user is a superuser
+    if role is None:
+        role = 'admin' if user.is_superuser else 'clerk'
+    return role
+
+
+def user_claims(user):
+    return {
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'role': user_role(user),
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+    }
+
+
+class ClaimsUser(TokenUser):
+    """Request user built from token claims; it has no database row behind it."""
+
+    @property
+    def email(self):
+        return self.token.get('email', '')
+
+    @property
+    def first_name(self):
+        return self.token.get('first_name', '')
+
+    @property
+    def last_name(self):
+        return self.token.get('last_name', '')
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+
+class _TTLCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl, max_entries):
+        with self._lock:
+            if len(self._entries) >= max_entries:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_validated = _TTLCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that never touches the database.
+
+    Tokens carrying the USER_CLAIMS become a ClaimsUser; tokens issued before
+    the claims existed fall back to the usual user lookup. Validated tokens are
+    kept for JWT_AUTH_CACHE_TTL seconds (never past their expiry) so repeat
+    requests skip signature verification as well. Claims can be up to one
+    access-token lifetime stale, so views that change the user (e.g.
+    ChangePasswordView) keep the database-backed JWTAuthentication.
+    """
+
+    def get_validated_token(self, raw_token):
+        cached = _validated.get(raw_token)
+        if cached is not None:
+            return cached
+        token = super().get_validated_token(raw_token)
+        ttl = min(
+            getattr(settings, 'JWT_AUTH_CACHE_TTL', 60),
+            token.get('exp', 0) - time.time(),
+        )
+        if ttl > 0:
+            _validated.set(raw_token, token, ttl, getattr(settings, 'JWT_AUTH_CACHE_SIZE', 10000))
+        return token
+
+    def get_user(self, validated_token):
+        if 'role' in validated_token:
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
+
+
+def clear_token_cache():
+    _validated.clear()
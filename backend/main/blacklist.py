@@ -0,0 +1,112 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def sync_interval():
+    return getattr(settings, 'JWT_BLACKLIST_SYNC_INTERVAL', 5)
+
+
+def sync_overlap():
+    return getattr(settings, 'JWT_BLACKLIST_SYNC_OVERLAP', 100)
+
+
+class BlacklistCache:
+    """In-process set of blacklisted refresh-token jtis.
+
+    Loaded from the unexpired BlacklistedToken rows on first use, then topped
+    up with only the rows added since at most once every
+    JWT_BLACKLIST_SYNC_INTERVAL seconds, so a refresh costs a dict lookup no
+    matter how big the tables get. Each top-up re-reads the last
+    JWT_BLACKLIST_SYNC_OVERLAP ids as well: ids are handed out at insert, so
+    a slow transaction can commit a lower id after a higher one was synced.
+    Logouts in this process land immediately; logouts handled by another
+    worker show up within one sync interval.
+    """
+
+    def __init__(self):
+        self._expiries = {}  # jti -> exp (epoch seconds)
+        self._last_id = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        self.sync()
+        return jti in self._expiries
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._expiries[jti] = exp
+
+    def sync(self, force=False):
+        if not force and self._last_id is not None and time.monotonic() - self._synced_at < sync_interval():
+            return
+        with self._lock:
+            if not force and self._last_id is not None and time.monotonic() - self._synced_at < sync_interval():
+                return
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            if self._last_id is not None:
+                rows = rows.filter(id__gt=self._last_id - sync_overlap())
+            last_id = self._last_id or 0
+            for pk, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at').order_by('id'):
+                self._expiries[jti] = expires_at.timestamp()
+                last_id = max(last_id, pk)
+            self._last_id = last_id
+            self._synced_at = time.monotonic()
+            # Expired tokens fail signature checks anyway, drop them
+            now = time.time()
+            for jti in [jti for jti, exp in self._expiries.items() if exp <= now]:
+                del self._expiries[jti]
+
+    def clear(self):
+        with self._lock:
+            self._expiries.clear()
+            self._last_id = None
+            self._synced_at = 0.0
+
+
+blacklisted = BlacklistCache()
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check reads BlacklistCache instead of the database."""
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in blacklisted:
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklisted.add(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
+
+
+def prune_expired_tokens(batch_size=1000):
+    """Delete expired outstanding tokens (and their blacklist rows) in batches.
+
+    Each batch is its own short transaction so the tables are never locked for
+    long. Returns the number of outstanding tokens removed.
+    """
+    removed = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return removed
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        removed += len(ids)
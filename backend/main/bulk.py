@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Crop, Farmer, FarmType
+from .locations import resolve_locations
+from .stats import DIMENSIONS, apply_farmer_changes
+from .sync import record_changes
+
+UPSERT_FIELDS = ['name', 'location', 'location_ref', 'farm_type', 'crop', 'updated_at']
+
+
+class FarmerBulkRowSerializer(serializers.Serializer):
+    # Plain serializer on purpose: no per-row FK or uniqueness queries, the
+    # foreign keys are checked against id sets loaded once per request.
+    name = serializers.CharField(max_length=255)
+    national_id = serializers.CharField(max_length=20)
+    location = serializers.CharField(max_length=255, required=False, default='Harare')
+    farm_type = serializers.IntegerField()
+    crop = serializers.IntegerField()
+
+    def validate(self, attrs):
+        errors = {}
+        if attrs['farm_type'] not in self.context['farm_type_ids']:
+            errors['farm_type'] = [f"Invalid pk \"{attrs['farm_type']}\" - object does not exist."]
+        if attrs['crop'] not in self.context['crop_ids']:
+            errors['crop'] = [f"Invalid pk \"{attrs['crop']}\" - object does not exist."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+def bulk_chunk_size():
+    return getattr(settings, 'FARMER_BULK_CHUNK_SIZE', 500)
+
+
+def bulk_max_rows():
+    return getattr(settings, 'FARMER_BULK_MAX_ROWS', 10000)
+
+
+def upsert_farmer_rows(rows):
+    national_ids = [row['national_id'] for row in rows]
+    # bulk_create skips the pre_save signal that links Location rows
+    locations = resolve_locations(row['location'] for row in rows)
+    # Stored values of the rows being overwritten, to move the stats counters
+    previous = {
+        row['national_id']: row
+        for row in Farmer.objects.filter(national_id__in=national_ids).values('national_id', *DIMENSIONS.values())
+    }
+    existing = set(previous)
+    Farmer.objects.bulk_create(
+        [
+            Farmer(
+                name=row['name'],
+                national_id=row['national_id'],
+                location=row['location'],
+                location_ref_id=locations[row['location']][0],
+                farm_type_id=row['farm_type'],
+                crop_id=row['crop'],
+            )
+            for row in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['national_id'],
+        update_fields=UPSERT_FIELDS,
+    )
+    ids = dict(Farmer.objects.filter(national_id__in=national_ids).values_list('national_id', 'id'))
+    record_changes(Farmer, ids.values())
+    # bulk_create skips the Farmer signals that keep the counters current
+    apply_farmer_changes(
+        (previous.get(row['national_id']), stat_values(row)) for row in rows
+    )
+    return existing, ids
+
+
+def stat_values(row):
+    # Validated row -> the Farmer field values the stats counters group on
+    return {'farm_type_id': row['farm_type'], 'crop_id': row['crop'], 'location': row['location']}
+
+
+def bulk_upsert_farmers(rows, chunk_size=None):
+    """Validate and upsert farmer rows keyed on national_id.
+
+    Returns one result per input row, in input order. Each chunk is written in
+    its own short transaction so a large batch never holds the write lock for
+    long.
+    """
+    chunk_size = chunk_size or bulk_chunk_size()
+    context = {
+        'farm_type_ids': set(FarmType.objects.values_list('id', flat=True)),
+        'crop_ids': set(Crop.objects.values_list('id', flat=True)),
+    }
+
+    results = [None] * len(rows)
+    valid = {}  # national_id -> (index, data); a later duplicate wins
+    for index, row in enumerate(rows):
+        serializer = FarmerBulkRowSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+            continue
+        national_id = serializer.validated_data['national_id']
+        if national_id in valid:
+            superseded = valid[national_id][0]
+            results[superseded] = {
+                'index': superseded,
+                'national_id': national_id,
+                'status': 'skipped',
+                'errors': {'national_id': [f'Superseded by row {index}.']},
+            }
+        valid[national_id] = (index, serializer.validated_data)
+
+    pending = list(valid.values())
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        with transaction.atomic():
+            existing, ids = upsert_farmer_rows([data for _, data in chunk])
+        for index, data in chunk:
+            national_id = data['national_id']
+            results[index] = {
+                'index': index,
+                'national_id': national_id,
+                'status': 'updated' if national_id in existing else 'created',
+                'id': ids[national_id],
+            }
+    return results
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .conditional import request_versions
+from .models import Crop, Farmer, FarmType, Location
+
+# Tables each cached endpoint's payload is built from. Their versions (newest
+# SyncChange id, see main.conditional) are part of every key, so a write from
+# any process, web or task worker, moves the endpoint to fresh keys.
+ENDPOINT_TABLES = {
+    'farm-types': (FarmType,),
+    'crops': (Crop,),
+    'farmers': (Farmer, FarmType, Crop, Location),
+}
+DEFAULT_TTL = 60
+
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_counters_lock = threading.Lock()
+
+
+def api_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def cache_enabled():
+    return getattr(settings, 'API_CACHE_ENABLED', True)
+
+
+def endpoint_ttl(endpoint):
+    return getattr(settings, 'API_CACHE_TTLS', {}).get(endpoint, DEFAULT_TTL)
+
+
+def _count(endpoint, outcome):
+    with _counters_lock:
+        _counters[endpoint][outcome] += 1
+
+
+def cache_stats():
+    with _counters_lock:
+        return {
+            endpoint: {**counts, 'ttl': endpoint_ttl(endpoint)}
+            for endpoint, counts in sorted(_counters.items())
+        }
+
+
+def reset_cache_stats():
+    with _counters_lock:
+        _counters.clear()
+
+
+class CachedResponseMixin:
+    """Cache serialized list/retrieve payloads per endpoint and query string.
+
+    ``cache_endpoint`` names the entry in ENDPOINT_TABLES and API_CACHE_TTLS.
+    A hit costs the one query that reads the table versions.
+    """
+    cache_endpoint = None
+
+    def get_cache_key(self, request, action):
+        versions = request_versions(request, ENDPOINT_TABLES[self.cache_endpoint])
+        # Absolute media URLs depend on the host, the payload on the query
+        digest = hashlib.sha1(f'{request.get_host()}|{request.get_full_path()}'.encode()).hexdigest()
+        return f"api:{self.cache_endpoint}:{action}:{'.'.join(map(str, versions))}:{digest}"
+
+    def cached(self, handler, action, request, *args, **kwargs):
+        if not cache_enabled():
+            return handler(request, *args, **kwargs)
+
+        cache = api_cache()
+        key = self.get_cache_key(request, action)
+        data = cache.get(key)
+        if data is not None:
+            _count(self.cache_endpoint, 'hits')
+            return Response(data)
+
+        _count(self.cache_endpoint, 'misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, endpoint_ttl(self.cache_endpoint))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, 'list', request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, 'detail', request, *args, **kwargs)
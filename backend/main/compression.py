@@ -0,0 +1,124 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Already compressed, recompressing only burns CPU (the farmer export's
+# ?gzip=1 output is application/gzip)
+INCOMPRESSIBLE_TYPES = ('image/', 'video/', 'audio/', 'application/gzip', 'application/x-gzip', 'application/zip')
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = None
+    for coding in candidates:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        # Ties go to the earlier (smaller output) coding
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+
+
+def _brotli_sequence(chunks):
+    compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    for chunk in chunks:
+        # Flush per chunk like compress_sequence, so streamed exports keep flowing
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """Brotli or gzip response compression, negotiated from Accept-Encoding.
+
+    Like Django's GZipMiddleware (whose BREACH length padding the gzip side
+    keeps), plus brotli when the ``brotli`` package is installed, a
+    COMPRESSION_MIN_BYTES threshold so small responses go out as they are,
+    and no recompression of content that is already compressed.
+    """
+
+    max_random_bytes = 100
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+            return response
+        if response.has_header('Content-Encoding') or response.has_header('Content-Range'):
+            return response  # Already encoded, or a byte range of the identity body
+        if response.get('Content-Type', '').startswith(INCOMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes
+                )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli_compress(response.content)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The bytes differ from the uncompressed ones, so a strong ETag has to go weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
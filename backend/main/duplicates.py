@@ -0,0 +1,232 @@
+import difflib
+import itertools
+import operator
+import re
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Replace, Upper
+
+from .models import Farmer
+
+_ID_SEPARATORS = re.compile(r'[ /-]')  # Same characters migrations 0012 and 0015 strip in SQL
+_NORMALIZED_ID_SQL = "UPPER(REPLACE(REPLACE(REPLACE(national_id, '-', ''), ' ', ''), '/', ''))"
+_SPACES = re.compile(r'\s+')
+_WORDS = re.compile(r'\S{3,}')
+_index_available = {}  # database NAME -> farmer_similarity table / pg_trgm exists
+
+
+def normalize_national_id(value):
+    # '63-123456 A00' and '63123456a00' are the same ID
+    return _ID_SEPARATORS.sub('', value or '').upper()
+
+
+def normalize_name(value):
+    return _SPACES.sub(' ', value or '').strip().lower()
+
+
+def _ratio(a, b):
+    return difflib.SequenceMatcher(None, a, b).ratio() if a and b else 0.0
+
+
+def name_similarity(a, b):
+    a, b = normalize_name(a), normalize_name(b)
+    # Clerks swap first and last names as often as they misspell them
+    swapped = _ratio(' '.join(sorted(a.split())), ' '.join(sorted(b.split())))
+    return max(_ratio(a, b), swapped)
+
+
+def national_id_similarity(a, b):
+    return _ratio(normalize_national_id(a), normalize_national_id(b))
+
+
+def _index_exists(sql):
+    name = connection.settings_dict['NAME']
+    if name not in _index_available:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            _index_available[name] = cursor.fetchone() is not None
+    return _index_available[name]
+
+
+def has_similarity_index():
+    if connection.vendor != 'sqlite':
+        return False
+    return _index_exists("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'farmer_similarity'")
+
+
+def has_trigram_index():
+    if connection.vendor != 'postgresql':
+        return False
+    return _index_exists("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+
+
+def _quote(term):
+    return '"%s"' % term.replace('"', '""')
+
+
+def _trigrams(value):
+    return sorted({value[i:i + 3] for i in range(len(value) - 2)})
+
+
+def _match_expression(column, value):
+    # Any shared trigram makes a candidate; bm25 ranks those sharing the most first
+    trigrams = _trigrams(value)
+    if not trigrams:
+        return None
+    return f"{column} : ({' OR '.join(map(_quote, trigrams))})"
+
+
+def _two_of(units):
+    if len(units) < 2:
+        return units[0]
+    return '(%s)' % ' OR '.join(f'({a} AND {b})' for a, b in itertools.combinations(units, 2))
+
+
+def _name_expression(name, max_words=4):
+    # A candidate has to resemble two of the name's words (two of its
+    # trigrams for one-word names): any single shared trigram matches most of
+    # the table, and bm25 then scores every row. A word counts as resembled
+    # when any of its trigrams matches, including those reaching into the
+    # neighbouring word, as a typo can leave a short word none of its own.
+    spans = sorted((m.span() for m in _WORDS.finditer(name)), key=lambda span: span[0] - span[1])[:max_words]
+    if len(spans) >= 2:
+        units = [
+            '(%s)' % ' OR '.join(_quote(trigram) for trigram in _trigrams(name[max(start - 2, 0):end]))
+            for start, end in spans
+        ]
+    else:
+        units = [_quote(trigram) for trigram in _trigrams(name)]
+    return f'name : {_two_of(units)}' if units else None
+
+
+def _chunks(value, parts=3):
+    # A typo or swapped pair touches at most two of three chunks
+    if len(value) < 3:
+        return []
+    size = max(-(-len(value) // parts), 3)
+    chunks = [value[i:i + size] for i in range(0, len(value), size)]
+    if len(chunks) > 1 and len(chunks[-1]) < 3:
+        chunks[-2] += chunks.pop()
+    return chunks
+
+
+def _chunk_expression(column, value):
+    # IDs share digit trigrams with most of the table, so match whole chunks
+    # instead. A typo or swapped pair breaks at most two chunks: of four, two
+    # must survive; shorter IDs only get three and need one.
+    if len(value) < 9:
+        return _match_expression(column, value)
+    if len(value) >= 12:
+        return f'{column} : {_two_of([_quote(chunk) for chunk in _chunks(value, 4)])}'
+    return f"{column} : ({' OR '.join(map(_quote, _chunks(value)))})"
+
+
+def _ranked_matches(expression, limit):
+    # Matches stream in rowid order for free, but ORDER BY rank scores every
+    # one of them with bm25: rank only the first FARMER_SIMILAR_SCAN
+    scan = max(getattr(settings, 'FARMER_SIMILAR_SCAN', 500), limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM (SELECT rowid, rank FROM farmer_similarity WHERE farmer_similarity MATCH %s LIMIT %s) '
+            'ORDER BY rank LIMIT %s',
+            [expression, scan, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _indexed_candidates(name, national_id, limit):
+    # One query per field, so a common name can't fill the scan before an ID match
+    ids = []
+    for expression in (_chunk_expression('national_id', national_id), _name_expression(name)):
+        if expression:
+            ids += [pk for pk in _ranked_matches(expression, limit) if pk not in ids]
+    return ids
+
+
+def _trigram_candidates(name, national_id, limit):
+    # PostgreSQL: % finds candidates through the pg_trgm GIN indexes from
+    # migration 0015 (above pg_trgm.similarity_threshold), similarity() ranks them
+    columns = [(sql, value) for sql, value in (('LOWER(name)', name), (_NORMALIZED_ID_SQL, national_id)) if value]
+    if not columns:
+        return []
+    where = ' OR '.join(f'{sql} %% %s' for sql, _ in columns)
+    rank = ' + '.join(f'similarity({sql}, %s)' for sql, _ in columns)
+    values = [value for _, value in columns]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM main_farmer WHERE {where} ORDER BY {rank} DESC, id LIMIT %s',
+            values + values + [limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _substring_candidates(name, national_id, limit):
+    # Any other backend: farmers containing a chunk of the name or normalized
+    # ID, those sharing the most chunks first. No index helps here, it scans.
+    conditions = [Q(name__icontains=chunk) for chunk in _chunks(name)]
+    conditions += [Q(normalized_id__contains=chunk) for chunk in _chunks(national_id)]
+    if not conditions:
+        return []
+    normalized_id = Upper(reduce(
+        lambda expression, separator: Replace(expression, Value(separator), Value('')), '- /', 'national_id'
+    ))
+    hits = reduce(operator.add, [Case(When(condition, then=1), default=0) for condition in conditions])
+    return list(
+        Farmer.objects.alias(normalized_id=normalized_id)
+        .filter(reduce(operator.or_, conditions))
+        .annotate(hits=hits)
+        .order_by('-hits', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def find_similar_farmers(name='', national_id='', exclude=None, limit=10, min_score=None):
+    """Existing farmers that look like ``name`` and/or ``national_id``, best first.
+
+    Candidates come from the farmer_similarity trigram index on SQLite
+    (migration 0012), pg_trgm on PostgreSQL (migration 0015) or a ranked
+    substring scan elsewhere, and are then scored in Python: each given field
+    is compared with SequenceMatcher after normalizing, and ``score`` is the
+    average. Only candidates scoring at least ``min_score`` are returned.
+    """
+    if min_score is None:
+        min_score = getattr(settings, 'FARMER_SIMILAR_MIN_SCORE', 0.6)
+    name, national_id = normalize_name(name), normalize_national_id(national_id)
+    candidate_limit = getattr(settings, 'FARMER_SIMILAR_CANDIDATES', 50)
+    if has_similarity_index():
+        ids = _indexed_candidates(name, national_id, candidate_limit)
+    elif has_trigram_index():
+        ids = _trigram_candidates(name, national_id, candidate_limit)
+    else:
+        ids = _substring_candidates(name, national_id, candidate_limit)
+    if exclude is not None:
+        ids = [pk for pk in ids if pk != exclude]
+
+    results = []
+    for row in Farmer.objects.filter(id__in=ids).values('id', 'name', 'national_id', 'location'):
+        scores = {}
+        if name:
+            scores['name_score'] = name_similarity(name, row['name'])
+        if national_id:
+            scores['national_id_score'] = national_id_similarity(national_id, row['national_id'])
+        score = sum(scores.values()) / len(scores) if scores else 0.0
+        if score >= min_score:
+            results.append({**row, 'score': round(score, 3), **{k: round(v, 3) for k, v in scores.items()}})
+    results.sort(key=lambda result: (-result['score'], result['id']))
+    return results[:limit]
+
+
+def rebuild_similarity_index():
+    """Refill farmer_similarity from main_farmer, e.g. after restoring a dump without triggers."""
+    if not has_similarity_index():
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM farmer_similarity')
+        cursor.execute(
+            "INSERT INTO farmer_similarity (rowid, name, national_id) SELECT id, name, "
+            "UPPER(REPLACE(REPLACE(REPLACE(national_id, '-', ''), ' ', ''), '/', '')) FROM main_farmer"
+        )
+    return True
@@ -0,0 +1,77 @@
+import csv
+import json
+import zlib
+
+# (column name, Farmer lookup) in export order
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('national_id', 'national_id'),
+    ('location', 'location'),
+    ('farm_type_id', 'farm_type_id'),
+    ('farm_type', 'farm_type__name'),
+    ('crop_id', 'crop_id'),
+    ('crop', 'crop__name'),
+    ('updated_at', 'updated_at'),
+]
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000  # rows fetched per database round trip
+FLUSH_BYTES = 64 * 1024  # bytes buffered before a chunk is sent
+
+
+class _Echo:
+    # csv.writer target that hands back each formatted line
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.order_by('id').values_list(*lookups).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+
+
+def _ndjson_lines(rows):
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + '\n'
+
+
+def _buffered(lines):
+    # Group lines into ~64 KB chunks instead of one write per row
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(queryset, export_format='csv', gzip=False):
+    """Yield the export as bytes chunks; memory stays flat at any table size."""
+    rows = export_rows(queryset)
+    lines = _csv_lines(rows) if export_format == 'csv' else _ndjson_lines(rows)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if gzip else chunks
@@ -0,0 +1,54 @@
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .locations import bbox_query, parse_bbox
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ["A valid integer is required."]})
+
+
+def filter_farmers(queryset, params):
+    """Apply the farmer list query parameters to ``queryset``.
+
+    ``location`` is an exact match, ``location_id``, ``farm_type`` and
+    ``crop`` take ids, ``bbox`` keeps farmers whose Location lies inside it
+    (via the Location grid index) and
+    ``search`` is a case-insensitive prefix match on name or national_id, all
+    served by indexes. ``match=contains`` turns search into a substring match,
+    which has to scan the table.
+    """
+    location = params.get('location')
+    if location:
+        queryset = queryset.filter(location=location)
+
+    location_id = _int_param(params, 'location_id')
+    if location_id is not None:
+        queryset = queryset.filter(location_ref_id=location_id)
+
+    bbox = params.get('bbox')
+    if bbox:
+        queryset = queryset.filter(bbox_query(parse_bbox(bbox), prefix='location_ref__'))
+
+    farm_type = _int_param(params, 'farm_type')
+    if farm_type is not None:
+        queryset = queryset.filter(farm_type_id=farm_type)
+
+    crop = _int_param(params, 'crop')
+    if crop is not None:
+        queryset = queryset.filter(crop_id=crop)
+
+    search = params.get('search', '').strip()
+    if search:
+        if params.get('match') == 'contains':
+            queryset = queryset.filter(Q(name__icontains=search) | Q(national_id__icontains=search))
+        else:
+            queryset = queryset.filter(Q(name__istartswith=search) | Q(national_id__istartswith=search))
+
+    return queryset
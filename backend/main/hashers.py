@@ -0,0 +1,134 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, make_password
+from django.db import close_old_connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with costs from settings.PASSWORD_ARGON2 instead of Django's 100 MB default.
+
+    The algorithm name stays 'argon2', so changing the costs makes
+    must_update() flag old hashes and they get upgraded on the next login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2.get('time_cost', 2)
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2.get('memory_cost', 19456)
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2.get('parallelism', 1)
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins at once, please try again shortly.'
+    default_code = 'hashing_busy'
+
+
+_slots = None
+_waiting = 0
+_slots_lock = threading.Lock()
+_holding = threading.local()  # .slot is True while this thread has a slot
+
+
+def _get_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(getattr(settings, 'PASSWORD_HASH_CONCURRENCY', 2))
+        return _slots
+
+
+@contextmanager
+def hashing_slot():
+    """Hold one of PASSWORD_HASH_CONCURRENCY slots while hashing or checking a password.
+
+    Hashing is CPU (and for argon2, memory) heavy; capping it per process keeps
+    a burst of logins from eating every core the rest of the API needs. At most
+    PASSWORD_HASH_QUEUE requests wait (up to PASSWORD_HASH_WAIT seconds) for a
+    slot, so waiting logins can't tie up every server thread either; the rest
+    get a 503 straight away.
+    """
+    global _waiting
+    slots = _get_slots()
+    if not slots.acquire(blocking=False):
+        with _slots_lock:
+            if _waiting >= getattr(settings, 'PASSWORD_HASH_QUEUE', 8):
+                raise HashingBusy()
+            _waiting += 1
+        try:
+            acquired = slots.acquire(timeout=getattr(settings, 'PASSWORD_HASH_WAIT', 5))
+        finally:
+            with _slots_lock:
+                _waiting -= 1
+        if not acquired:
+            raise HashingBusy()
+    _holding.slot = True
+    try:
+        yield
+    finally:
+        _holding.slot = False
+        slots.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-rehash')
+        return _executor
+
+
+def rehash_password(user_id, old_encoded, raw_password):
+    from .models import CustomUser
+
+    # An inline rehash runs inside check_password, under the login's slot;
+    # taking a second one would wait on ourselves when the cap is 1
+    with nullcontext() if getattr(_holding, 'slot', False) else hashing_slot():
+        encoded = make_password(raw_password)
+    # Only replace the hash we checked, never a password changed in the meantime
+    CustomUser.objects.filter(pk=user_id, password=old_encoded).update(password=encoded)
+
+
+def _run_in_worker(user_id, old_encoded, raw_password):
+    close_old_connections()
+    try:
+        rehash_password(user_id, old_encoded, raw_password)
+    except Exception:
+        logger.exception("Password rehash failed for user %s", user_id)
+    finally:
+        with _executor_lock:
+            _pending.discard(user_id)
+        close_old_connections()
+
+
+def schedule_rehash(user, raw_password):
+    """Upgrade an outdated hash after the login response instead of during it."""
+    if not getattr(settings, 'PASSWORD_REHASH_ASYNC', True):
+        rehash_password(user.pk, user.password, raw_password)
+        return
+    with _executor_lock:
+        # One queued upgrade per user is enough; a later login retries if it fails
+        if user.pk in _pending:
+            return
+        _pending.add(user.pk)
+    old_encoded = user.password
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, user.pk, old_encoded, raw_password))
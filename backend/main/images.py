@@ -0,0 +1,154 @@
+import base64
+import logging
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Crop
+from .tasks import enqueue, task
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+# Variant name -> longest edge in pixels. Every variant is re-encoded as WebP.
+VARIANTS = {'large': 1280, 'medium': 480, 'thumb': 160}
+VARIANT_DIR = 'crops/variants/'
+DECODE_CHUNK = 64 * 1024  # base64 characters read per decode step
+SPOOL_SIZE = 1024 * 1024  # decoded bytes kept in memory before spilling to disk
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def check_image_size(size, limit):
+    if size > limit:
+        raise InvalidImage(f"Image is larger than {limit // (1024 * 1024)} MB.")
+
+
+def prepare_upload(upload, limit):
+    """Validate an uploaded image file (multipart or raw body)."""
+    check_image_size(upload.size, limit)
+    image_type = sniff_image(upload)
+    upload.name = f"uploaded_image.{ALLOWED_FORMATS[image_type]}"
+    return upload
+
+
+def decode_data_uri(value, limit=None):
+    """Decode a ``data:image/...;base64,`` string into a temporary file.
+
+    The payload is decoded in slices so only one small slice of decoded bytes
+    is in memory at a time, then sniffed with Pillow.
+    """
+    header, separator, data = value.partition(';base64,')
+    if not header.startswith('data:image') or not separator:
+        raise InvalidImage("Invalid image format.")
+    if limit is not None:
+        check_image_size(len(data) * 3 // 4, limit)
+
+    spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    pending = ''
+    try:
+        for start in range(0, len(data), DECODE_CHUNK):
+            # MIME-wrapped payloads carry newlines: drop whitespace and decode
+            # whole 4-character groups, carrying the rest into the next slice
+            pending += ''.join(data[start:start + DECODE_CHUNK].split())
+            usable = len(pending) - len(pending) % 4
+            spool.write(base64.b64decode(pending[:usable]))
+            pending = pending[usable:]
+        if pending:
+            spool.write(base64.b64decode(pending))  # Unpadded tail; b64decode rejects it
+    except (ValueError, TypeError):
+        spool.close()
+        raise InvalidImage("Invalid base64 image data.")
+
+    image_type = sniff_image(spool)
+    return File(spool, name=f"uploaded_image.{ALLOWED_FORMATS[image_type]}")
+
+
+def sniff_image(file):
+    # Replaces imghdr: let Pillow identify and verify the header
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_type = (image.format or '').lower()
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise InvalidImage("Unsupported image type.")
+    finally:
+        file.seek(0)
+    if image_type not in ALLOWED_FORMATS:
+        raise InvalidImage("Unsupported image type.")
+    return image_type
+
+
+def render_variants(source):
+    image = ImageOps.exif_transpose(Image.open(source))
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    for name, edge in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((edge, edge))
+        buffer = BytesIO()
+        variant.save(buffer, 'WEBP', quality=80, method=4)
+        yield name, buffer.getvalue()
+
+
+@task('crop_image')
+def process_crop_image(crop_id):
+    """Generate the WebP variants for a crop's uploaded image."""
+    crop = Crop.objects.filter(pk=crop_id).first()
+    if crop is None or not crop.image:
+        return
+
+    storage = crop.image.storage
+    try:
+        with crop.image.open('rb') as source:
+            rendered = list(render_variants(source))
+    except (OSError, UnidentifiedImageError):
+        logger.exception("Could not process image for crop %s", crop_id)
+        crop.image_status = Crop.IMAGE_FAILED
+        crop.save(update_fields=['image_status', 'updated_at'])
+        return
+
+    # Save the new variants before releasing the old ones: identical bytes
+    # share one stored file, which must not be removed in between
+    old_variants = list(crop.image_variants.values())
+    crop.image_variants = {
+        name: storage.save(f"{VARIANT_DIR}{crop.pk}_{name}.webp", ContentFile(data))
+        for name, data in rendered
+    }
+    crop.image_status = Crop.IMAGE_READY
+    crop.save(update_fields=['image_variants', 'image_status', 'updated_at'])
+    for old in old_variants:
+        storage.delete(old)
+
+
+def replace_crop_image(crop, image):
+    """Save ``image`` as the crop's original and release the one it replaces."""
+    old = crop.image.name
+    crop.image.save(image.name, image, save=True)
+    if old:
+        crop.image.storage.delete(old)
+
+
+def release_crop_images(crop):
+    """Drop the crop's references to its original and variants (see main.storage)."""
+    storage = crop.image.storage
+    for name in [crop.image.name, *crop.image_variants.values()]:
+        if name:
+            storage.delete(name)
+
+
+def schedule_crop_image(crop):
+    """Queue variant generation on the task queue (see main.tasks) and return
+    the Task, or process inline and return None when CROP_IMAGE_ASYNC is off."""
+    # A real save, so the sync log and cached crop responses see the status
+    crop.image_status = Crop.IMAGE_PENDING
+    crop.save(update_fields=['image_status', 'updated_at'])
+    if getattr(settings, 'CROP_IMAGE_ASYNC', True):
+        return enqueue('crop_image', crop.pk)
+    process_crop_image(crop.pk)
@@ -0,0 +1,186 @@
+import csv
+import time
+
+from django.db import transaction
+
+from .bulk import stat_values, upsert_farmer_rows
+from .models import Crop, Farmer, FarmType
+from .locations import resolve_locations
+from .stats import apply_farmer_changes
+from .sync import record_changes
+
+IMPORT_COLUMNS = ['name', 'national_id', 'location', 'farm_type', 'crop']
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.rejected
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'rejected': self.rejected,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class ImportAborted(ValueError):
+    """The file became unreadable part way; ``result`` counts the batches already committed."""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+class FarmerImporter:
+    """Stream farmer rows from a CSV file into the database in batches.
+
+    Farm types and crops are given by name and resolved through maps loaded
+    once. Rows whose national_id already exists are rejected unless
+    ``update_existing`` is set. Each batch is one transaction.
+    ``on_reject(row, error)`` is called for every rejected row and
+    ``on_batch(result)`` after every committed batch.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, update_existing=False, on_reject=None, on_batch=None):
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.on_reject = on_reject
+        self.on_batch = on_batch
+        self.farm_types = {name.lower(): pk for pk, name in FarmType.objects.values_list('id', 'name')}
+        self.crops = {}
+        for pk, name in Crop.objects.order_by('-id').values_list('id', 'name'):
+            self.crops[name.lower()] = pk  # crop names aren't unique, the oldest wins
+
+    def run(self, lines):
+        result = ImportResult()
+        reader = csv.DictReader(lines)
+        try:
+            fieldnames = reader.fieldnames or []
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not read the CSV header: {e}")
+        missing = [column for column in ('name', 'national_id', 'farm_type', 'crop') if column not in fieldnames]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+        self.seen = set()  # national_ids already taken by earlier rows of this file
+        batch = []
+        try:
+            for row in reader:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, result)
+                    batch = []
+            if batch:
+                self._import_batch(batch, result)
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Earlier batches are committed; report them along with the error
+            raise ImportAborted(f"Import stopped after line {reader.line_num}: {e}", result) from e
+        finally:
+            result.finished = time.monotonic()
+        return result
+
+    def _reject(self, row, error, result):
+        result.rejected += 1
+        if self.on_reject:
+            self.on_reject(row, error)
+
+    def _clean(self, row):
+        name = (row.get('name') or '').strip()
+        national_id = (row.get('national_id') or '').strip()
+        location = (row.get('location') or '').strip() or 'Harare'
+        if not name or len(name) > 255:
+            return None, "name is required (max 255 characters)"
+        if not national_id or len(national_id) > 20:
+            return None, "national_id is required (max 20 characters)"
+        if len(location) > 255:
+            return None, "location is too long (max 255 characters)"
+        farm_type = self.farm_types.get((row.get('farm_type') or '').strip().lower())
+        if farm_type is None:
+            return None, f"unknown farm_type {row.get('farm_type')!r}"
+        crop = self.crops.get((row.get('crop') or '').strip().lower())
+        if crop is None:
+            return None, f"unknown crop {row.get('crop')!r}"
+        return {
+            'name': name,
+            'national_id': national_id,
+            'location': location,
+            'farm_type': farm_type,
+            'crop': crop,
+        }, None
+
+    def _import_batch(self, rows, result):
+        cleaned = {}
+        for row in rows:
+            data, error = self._clean(row)
+            if error:
+                self._reject(row, error, result)
+            elif data['national_id'] in self.seen:
+                self._reject(row, "duplicate national_id in file", result)
+            else:
+                self.seen.add(data['national_id'])
+                cleaned[data['national_id']] = (row, data)
+
+        with transaction.atomic():
+            if self.update_existing:
+                existing, _ = upsert_farmer_rows([data for _, data in cleaned.values()])
+                result.updated += len(existing)
+                result.created += len(cleaned) - len(existing)
+            else:
+                existing = set(
+                    Farmer.objects.filter(national_id__in=list(cleaned)).values_list('national_id', flat=True)
+                )
+                for national_id in existing:
+                    self._reject(cleaned.pop(national_id)[0], "national_id already registered", result)
+                locations = resolve_locations(data['location'] for _, data in cleaned.values())
+                Farmer.objects.bulk_create(
+                    [
+                        Farmer(
+                            name=data['name'],
+                            national_id=data['national_id'],
+                            location=data['location'],
+                            location_ref_id=locations[data['location']][0],
+                            farm_type_id=data['farm_type'],
+                            crop_id=data['crop'],
+                        )
+                        for _, data in cleaned.values()
+                    ],
+                    ignore_conflicts=True,
+                )
+                # ignore_conflicts silently drops rows another request inserted
+                # meanwhile; only rows holding this file's values are ours
+                stored = Farmer.objects.filter(national_id__in=list(cleaned)).values_list(
+                    'id', 'national_id', 'name', 'location', 'farm_type_id', 'crop_id'
+                )
+                created = {}
+                for pk, national_id, *values in stored:
+                    data = cleaned[national_id][1]
+                    if values == [data['name'], data['location'], data['farm_type'], data['crop']]:
+                        created[national_id] = pk
+                for national_id in set(cleaned) - set(created):
+                    self._reject(cleaned[national_id][0], "national_id already registered", result)
+                record_changes(Farmer, created.values())
+                apply_farmer_changes((None, stat_values(cleaned[national_id][1])) for national_id in created)
+                result.created += len(created)
+
+        if self.on_batch:
+            self.on_batch(result)
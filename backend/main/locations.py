@@ -0,0 +1,135 @@
+import math
+import re
+
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Location
+
+# Grid index: the world is cut into GRID_DEGREES squares numbered row by row,
+# so a run of neighbouring cells in one row is a single BETWEEN on grid_cell.
+# Migration 0014 computes the same cells; change both together.
+GRID_DEGREES = 0.25
+GRID_COLUMNS = int(360 / GRID_DEGREES)
+KM_PER_DEGREE = 111.32
+_NOT_WORD = re.compile(r'[\W_]+')
+
+
+def location_key(name):
+    # 'Victoria-Falls', ' victoria falls ' and 'VICTORIA FALLS' are one place
+    return ' '.join(_NOT_WORD.sub(' ', name or '').split()).casefold()
+
+
+def resolve_locations(names):
+    """Map location strings to (Location id, canonical name).
+
+    Unknown places get a Location named after the first spelling seen. Costs
+    one query when every place exists, three otherwise, whatever the number
+    of names. Blank names map to (None, name).
+    """
+    keys = {name: location_key(name) for name in set(names)}
+    wanted = {key for key in keys.values() if key}
+    found = {
+        key: (pk, name)
+        for key, pk, name in Location.objects.filter(key__in=wanted).values_list('key', 'id', 'name')
+    }
+    missing = {key: ' '.join(name.split()) for name, key in keys.items() if key and key not in found}
+    if missing:
+        Location.objects.bulk_create(
+            [Location(name=name, key=key) for key, name in missing.items()], ignore_conflicts=True
+        )
+        found.update(
+            (key, (pk, name))
+            for key, pk, name in Location.objects.filter(key__in=list(missing)).values_list('key', 'id', 'name')
+        )
+    return {name: found.get(key, (None, name)) for name, key in keys.items()}
+
+
+def grid_position(latitude, longitude):
+    row = min(int((latitude + 90) // GRID_DEGREES), int(180 / GRID_DEGREES) - 1)
+    column = int((longitude + 180) // GRID_DEGREES) % GRID_COLUMNS
+    return row, column
+
+
+def grid_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    row, column = grid_position(latitude, longitude)
+    return row * GRID_COLUMNS + column
+
+
+def cells_query(first_row, last_row, first_column, last_column, prefix=''):
+    """Q matching grid cells in the given rectangle: one index range per grid row."""
+    first_column, last_column = max(first_column, 0), min(last_column, GRID_COLUMNS - 1)
+    first_row, last_row = max(first_row, 0), min(last_row, int(180 / GRID_DEGREES) - 1)
+    query = Q()
+    for row in range(first_row, last_row + 1):
+        start = row * GRID_COLUMNS
+        query |= Q(**{f'{prefix}grid_cell__range': (start + first_column, start + last_column)})
+    return query
+
+
+def parse_bbox(value):
+    """``min_lon,min_lat,max_lon,max_lat`` -> (min_lat, min_lon, max_lat, max_lon)."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValidationError({'bbox': ["Expected min_lon,min_lat,max_lon,max_lat."]})
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise ValidationError({'bbox': ["Coordinates out of range or min greater than max."]})
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def bbox_query(bbox, prefix=''):
+    """Q for locations inside ``bbox``: grid cells first, exact coordinates second."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    first_row, first_column = grid_position(min_lat, min_lon)
+    last_row, last_column = grid_position(max_lat, max_lon)
+    return cells_query(first_row, last_row, first_column, last_column, prefix) & Q(**{
+        f'{prefix}latitude__range': (min_lat, max_lat),
+        f'{prefix}longitude__range': (min_lon, max_lon),
+    })
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Haversine
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def with_farmer_counts(queryset):
+    return queryset.annotate(farmer_count=Count('farmers'))
+
+
+def nearest_locations(latitude, longitude, limit=5, max_km=500):
+    """The ``limit`` closest located places within ``max_km``, nearest first.
+
+    Searches a box of grid cells around the point, doubling it until the box
+    is known to contain the ``limit`` nearest (or reaches ``max_km``).
+    Each Location gets a ``distance_km`` attribute.
+    """
+    row, column = grid_position(latitude, longitude)
+    # Rows further than this from the point are all beyond max_km
+    max_radius = min(max(math.ceil(max_km / KM_PER_DEGREE / GRID_DEGREES), 1), int(180 / GRID_DEGREES))
+    radius = 1
+    while True:
+        # A degree of longitude shrinks towards the poles, so widen the columns
+        # until the box reaches as many km east and west as north and south
+        edge_latitude = min(abs(latitude) + radius * GRID_DEGREES, 89.0)
+        columns = min(math.ceil(radius / math.cos(math.radians(edge_latitude))), GRID_COLUMNS // 2)
+        candidates = with_farmer_counts(
+            Location.objects.filter(cells_query(row - radius, row + radius, column - columns, column + columns))
+        )
+        ranked = []
+        for location in candidates:
+            location.distance_km = distance_km(latitude, longitude, location.latitude, location.longitude)
+            if location.distance_km <= max_km:
+                ranked.append(location)
+        ranked.sort(key=lambda location: (location.distance_km, location.pk))
+
+        # Anything closer than the box's nearest edge has been seen
+        covered_km = radius * GRID_DEGREES * KM_PER_DEGREE
+        if radius >= max_radius or (len(ranked) >= limit and ranked[limit - 1].distance_km <= covered_km):
+            return ranked[:limit]
+        radius = min(radius * 2, max_radius)
@@ -0,0 +1,61 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importer import DEFAULT_BATCH_SIZE, IMPORT_COLUMNS, FarmerImporter, ImportAborted
+
+
+class Command(BaseCommand):
+    help = (
+        "Import farmers from a CSV file with columns name, national_id, location, "
+        "farm_type and crop (farm type and crop by name)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows inserted per transaction (default %(default)s)")
+        parser.add_argument('--update-existing', action='store_true',
+                            help="Update farmers whose national_id already exists instead of rejecting them")
+        parser.add_argument('--rejects', help="Where to write rejected rows (default <path>.rejected.csv)")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        rejects_path = options['rejects'] or f"{options['path']}.rejected.csv"
+
+        with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+            rejects = csv.DictWriter(rejects_file, fieldnames=IMPORT_COLUMNS + ['error'], extrasaction='ignore')
+            rejects.writeheader()
+
+            def on_batch(result):
+                self.stdout.write(f"{result.processed} rows, {result.rows_per_second:.0f} rows/sec")
+
+            importer = FarmerImporter(
+                batch_size=options['batch_size'],
+                update_existing=options['update_existing'],
+                on_reject=lambda row, error: rejects.writerow({**row, 'error': error}),
+                on_batch=on_batch,
+            )
+            try:
+                with open(options['path'], newline='', encoding='utf-8-sig') as source:
+                    result = importer.run(source)
+            except ImportAborted as e:
+                kept = e.result.as_dict()
+                raise CommandError(
+                    f"{e} ({kept['created']} new and {kept['updated']} updated farmers from earlier "
+                    f"batches were kept; rejected rows so far are in {rejects_path})"
+                )
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+
+        summary = result.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} new and {summary['updated']} updated farmers, "
+            f"rejected {summary['rejected']} in {summary['seconds']}s ({summary['rows_per_second']} rows/sec)."
+        ))
+        if result.rejected:
+            self.stdout.write(f"Rejected rows written to {rejects_path}")
+        else:
+            os.remove(rejects_path)
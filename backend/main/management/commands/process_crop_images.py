@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main.images import process_crop_image
+from main.models import Crop
+
+
+class Command(BaseCommand):
+    help = "Generate WebP variants for crop images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate variants for every crop image")
+
+    def handle(self, *args, **options):
+        crops = Crop.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            crops = crops.exclude(image_status=Crop.IMAGE_READY)
+
+        processed = 0
+        for crop_id in crops.values_list('id', flat=True).iterator():
+            process_crop_image(crop_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} crop images."))
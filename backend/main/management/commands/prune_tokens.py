@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired refresh tokens and their blacklist entries in small batches "
+        "(a lock-friendly flushexpiredtokens). Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Tokens deleted per transaction (default %(default)s)")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        removed = prune_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {removed} expired tokens."))
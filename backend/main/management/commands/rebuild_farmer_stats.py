@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.stats import rebuild_farmer_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard counters served by /api/stats/ from the Farmer table."
+
+    def handle(self, *args, **options):
+        rebuild_farmer_stats()
+        self.stdout.write(self.style.SUCCESS("Farmer stats rebuilt."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from main.duplicates import rebuild_similarity_index
+
+
+class Command(BaseCommand):
+    help = "Refill the farmer duplicate-detection index used by /api/farmers/similar/ from the Farmer table."
+
+    def handle(self, *args, **options):
+        if rebuild_similarity_index():
+            self.stdout.write(self.style.SUCCESS("Farmer similarity index rebuilt."))
+        else:
+            self.stdout.write("No similarity index on this database; prefix indexes are used instead.")
@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main.tasks import run_worker
+
+
+def _worker(stop, poll_interval, burst):
+    # The parent handles Ctrl-C/SIGTERM and tells every worker through ``stop``,
+    # so a task in progress is finished rather than cut off
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    run_worker(stop=stop, poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of worker processes for the background task queue (main.tasks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Worker processes (default %(default)s)")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking again (default %(default)s)")
+        parser.add_argument('--burst', action='store_true', help="Exit once no task is due")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError("--processes must be at least 1")
+
+        # Children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        workers = [
+            context.Process(target=_worker, args=(stop, options['poll_interval'], options['burst']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+
+        def shutdown(*args):
+            self.stdout.write("Stopping workers after their current task...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {len(workers)} task workers."))
+        for worker in workers:
+            worker.join()
+        self.stdout.write("Workers stopped.")
@@ -0,0 +1,106 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import content_digest
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_CHUNK = 64 * 1024
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None to send the whole file.
+
+    Raises ValueError when the range can't be satisfied (416).
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None  # No Range, or several ranges: the full file is always a valid answer
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # bytes=-500: the last 500 bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve MEDIA_ROOT files with caching validators and byte ranges.
+
+    Content-addressed files (main.storage) never change under their name, so
+    they get a year-long ``immutable`` Cache-Control and their sha256 as a
+    strong ETag; proxies and CDNs can keep them indefinitely. Older files
+    only get Last-Modified and a short max-age.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found.")
+
+    stat = os.stat(full_path)
+    digest = content_digest(path)
+    etag = quote_etag(digest) if digest else None
+
+    if etag and etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        # If-Range: only honour the range if the client holds the current file
+        if_range = request.headers.get('If-Range')
+        if byte_range and if_range and (etag is None or if_range != etag):
+            byte_range = None
+
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_read_range(full_path, start, length), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(length)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if etag:
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_LEGACY_MAX_AGE', 3600))
+    return response
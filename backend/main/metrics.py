@@ -0,0 +1,226 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+import traceback
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+slow_query_logger = logging.getLogger('main.slow_queries')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=('route', 'method')):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self._series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {series[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, label_values, amount=1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{{{_format_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _format_labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _build_metrics():
+    return {
+        'requests': Counter('http_requests_total', 'Requests handled, by route, method and status.',
+                            ('route', 'method', 'status')),
+        'latency': Histogram('http_request_duration_seconds', 'Time spent producing the response.',
+                             LATENCY_BUCKETS),
+        'size': Histogram('http_response_size_bytes', 'Response body size (streamed responses excluded).',
+                          SIZE_BUCKETS),
+        'queries': Histogram('db_queries_per_request', 'SQL queries run while handling a request.',
+                             QUERY_COUNT_BUCKETS),
+        'query_time': Counter('db_query_duration_seconds_total', 'Time spent in SQL queries.',
+                              ('route', 'method')),
+    }
+
+
+_metrics.update(_build_metrics())
+
+
+def reset_metrics():
+    with _lock:
+        _metrics.update(_build_metrics())
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'query_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection (see install_query_wrapper)."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.query_time += elapsed
+        threshold = getattr(settings, 'SLOW_QUERY_MS', None)
+        if threshold is not None and elapsed * 1000 >= threshold:
+            _log_slow_query(sql, elapsed)
+
+
+def _log_slow_query(sql, elapsed):
+    message = '%.1f ms: %s'
+    args = [elapsed * 1000, sql]
+    # Stack traces are what make the log useful, but format_stack is slow;
+    # only a sample of slow queries pays for one
+    if random.random() < getattr(settings, 'SLOW_QUERY_STACK_SAMPLE_RATE', 0.1):
+        message += '\n%s'
+        args.append(''.join(traceback.format_stack(limit=25)[:-2]))
+    slow_query_logger.warning(message, *args)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # view_name (e.g. 'farmer-detail') rather than the path keeps the label set small
+    return match.view_name if match is not None else 'unmatched'
+
+
+def _observe(request, response, elapsed, metrics):
+    route = _route(request)
+    if route == 'metrics':
+        return
+    method = request.method
+    size = None if response.streaming else len(response.content)
+    with _lock:
+        _metrics['requests'].inc((route, method, str(response.status_code)))
+        _metrics['latency'].observe((route, method), elapsed)
+        _metrics['queries'].observe((route, method), metrics.queries)
+        _metrics['query_time'].inc((route, method), metrics.query_time)
+        if size is not None:
+            _metrics['size'].observe((route, method), size)
+
+
+class MetricsMiddleware:
+    """Records latency, SQL query count/time and response size per route.
+
+    Queries are counted by record_queries, which reports to the request set
+    in a contextvar; contextvars follow the async ORM into its sync_to_async
+    threads, so /api/async/ views are counted too. Metrics live in process
+    memory like the response cache counters: every worker serves its own
+    /metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        _observe(request, response, time.perf_counter() - started, metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        _observe(request, response, time.perf_counter() - started, metrics)
+        return response
+
+
+def render_metrics():
+    with _lock:
+        lines = []
+        for metric in _metrics.values():
+            lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+# Case-insensitive prefix indexes matching how each backend compiles
+# istartswith: LIKE on SQLite (needs a NOCASE index) and UPPER(...) LIKE on
+# PostgreSQL (needs an expression index with text_pattern_ops).
+PREFIX_INDEXES = {
+    'sqlite': 'CREATE INDEX IF NOT EXISTS {name} ON main_farmer ({column} COLLATE NOCASE)',
+    'postgresql': 'CREATE INDEX IF NOT EXISTS {name} ON main_farmer (UPPER({column}::text) text_pattern_ops)',
+}
+PREFIX_COLUMNS = {'farmer_name_prefix_idx': 'name', 'farmer_national_id_prefix_idx': 'national_id'}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    sql = PREFIX_INDEXES.get(schema_editor.connection.vendor)
+    if sql:
+        for name, column in PREFIX_COLUMNS.items():
+            schema_editor.execute(sql.format(name=name, column=column))
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in PREFIX_INDEXES:
+        for name in PREFIX_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_sync_change_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='farmer',
+            index=models.Index(fields=['location'], name='farmer_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farmer',
+            index=models.Index(fields=['farm_type', 'crop'], name='farmer_farm_type_crop_idx'),
+        ),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:32
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_farmer_stats(apps, schema_editor):
+    Farmer = apps.get_model('main', 'Farmer')
+    FarmerStat = apps.get_model('main', 'FarmerStat')
+    rows = [FarmerStat(dimension='total', key='', count=Farmer.objects.count())]
+    for dimension, field in (('farm_type', 'farm_type_id'), ('crop', 'crop_id'), ('location', 'location')):
+        grouped = Farmer.objects.order_by().values(field).annotate(total=Count('id'))
+        rows += [FarmerStat(dimension=dimension, key=str(g[field]), count=g['total']) for g in grouped]
+    FarmerStat.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_farmer_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('farm_type', 'Farm type'), ('crop', 'Crop'), ('location', 'Location')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='unique_farmer_stat')],
+            },
+        ),
+        migrations.RunPython(backfill_farmer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_farmer_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crop',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='crop',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
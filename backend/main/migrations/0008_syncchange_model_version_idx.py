@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_crop_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='syncchange',
+            index=models.Index(fields=['model', 'id'], name='syncchange_model_version_idx'),
+        ),
+    ]
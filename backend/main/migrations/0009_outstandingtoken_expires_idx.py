@@ -0,0 +1,19 @@
+from django.db import migrations
+
+# simplejwt doesn't index expires_at; prune_tokens and the blacklist cache
+# both filter on it.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_syncchange_model_version_idx'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS outstandingtoken_expires_idx ON token_blacklist_outstandingtoken (expires_at)',
+            'DROP INDEX IF EXISTS outstandingtoken_expires_idx',
+        ),
+    ]
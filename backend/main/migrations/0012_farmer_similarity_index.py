@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+from django.db import migrations
+
+# FTS5 trigram index over farmer names and normalized national IDs for
+# duplicate detection (main.duplicates). Triggers keep it in step with
+# main_farmer, including bulk upserts and imports that skip model signals.
+# SQLite only; other backends fall back to prefix-index candidates.
+NORMALIZED_ID = "UPPER(REPLACE(REPLACE(REPLACE({0}.national_id, '-', ''), ' ', ''), '/', ''))"
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS farmer_similarity USING fts5(name, national_id, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS farmer_similarity_insert AFTER INSERT ON main_farmer BEGIN
+        INSERT INTO farmer_similarity (rowid, name, national_id) VALUES (new.id, new.name, {NORMALIZED_ID.format('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS farmer_similarity_update AFTER UPDATE OF name, national_id ON main_farmer BEGIN
+        DELETE FROM farmer_similarity WHERE rowid = old.id;
+        INSERT INTO farmer_similarity (rowid, name, national_id) VALUES (new.id, new.name, {NORMALIZED_ID.format('new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS farmer_similarity_delete AFTER DELETE ON main_farmer BEGIN
+        DELETE FROM farmer_similarity WHERE rowid = old.id;
+    END""",
+    f"INSERT INTO farmer_similarity (rowid, name, national_id) SELECT id, name, {NORMALIZED_ID.format('main_farmer')} FROM main_farmer",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS farmer_similarity_insert",
+    "DROP TRIGGER IF EXISTS farmer_similarity_update",
+    "DROP TRIGGER IF EXISTS farmer_similarity_delete",
+    "DROP TABLE IF EXISTS farmer_similarity",
+]
+
+
+def create_similarity_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_similarity_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_media_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_similarity_index, drop_similarity_index),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:40
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, transaction
+from django.db.models import Count
+
+# Frozen copies of main.locations.location_key / grid_cell
+GRID_DEGREES = 0.25
+GRID_COLUMNS = int(360 / GRID_DEGREES)
+BATCH_SIZE = 2000
+
+# Towns most registrations use, created with coordinates; other places are
+# created from the farmer rows and can be located later in the admin
+TOWNS = {
+    'Harare': (-17.8292, 31.0522),
+    'Bulawayo': (-20.1325, 28.6265),
+    'Mutare': (-18.9707, 32.6709),
+    'Gweru': (-19.4500, 29.8167),
+    'Kwekwe': (-18.9281, 29.8149),
+    'Chinhoyi': (-17.3667, 30.2000),
+    'Masvingo': (-20.0744, 30.8328),
+    'Kadoma': (-18.3333, 29.9167),
+    'Marondera': (-18.1853, 31.5519),
+    'Zvishavane': (-20.3267, 30.0665),
+    'Victoria Falls': (-17.9318, 25.8307),
+    'Kariba': (-16.5167, 28.8000),
+    'Bindura': (-17.3019, 31.3306),
+    'Chipinge': (-20.1883, 32.6236),
+}
+
+
+def location_key(name):
+    return ' '.join(re.sub(r'[\W_]+', ' ', name or '').split()).casefold()
+
+
+def grid_cell(latitude, longitude):
+    row = int((latitude + 90) // GRID_DEGREES)
+    column = int((longitude + 180) // GRID_DEGREES) % GRID_COLUMNS
+    return row * GRID_COLUMNS + column
+
+
+def backfill_locations(apps, schema_editor):
+    Farmer = apps.get_model('main', 'Farmer')
+    Location = apps.get_model('main', 'Location')
+
+    location_ids = {}
+    for name, (latitude, longitude) in TOWNS.items():
+        location, _ = Location.objects.get_or_create(key=location_key(name), defaults={
+            'name': name, 'latitude': latitude, 'longitude': longitude, 'grid_cell': grid_cell(latitude, longitude),
+        })
+        location_ids[location.key] = location.id
+
+    # One Location per other normalized spelling, named after its most common spelling
+    spellings = Farmer.objects.values('location').annotate(total=Count('id')).order_by('-total', 'location')
+    for row in spellings:
+        key = location_key(row['location'])
+        if not key or key in location_ids:
+            continue
+        location, _ = Location.objects.get_or_create(key=key, defaults={'name': ' '.join(row['location'].split())})
+        location_ids[key] = location.id
+
+    # Then the farmers, in id order and one short transaction per batch, so
+    # the write lock is never held for long on a large registry
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Farmer.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'location')[:BATCH_SIZE]
+            )
+            if not rows:
+                return
+            by_location = defaultdict(list)
+            for pk, location in rows:
+                location_id = location_ids.get(location_key(location))
+                if location_id:
+                    by_location[location_id].append(pk)
+            for location_id, ids in by_location.items():
+                Farmer.objects.filter(id__in=ids).update(location_ref_id=location_id)
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0013_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:55
+
+from django.db import migrations
+
+# pg_trgm GIN indexes for duplicate detection on PostgreSQL (main.duplicates
+# orders candidates by similarity()). The ID expression matches the one in
+# migration 0012 and duplicates._NORMALIZED_ID_SQL. pg_trgm is a trusted
+# extension from PostgreSQL 13, so the database owner can create it.
+# PostgreSQL only; SQLite has the FTS5 index from 0012.
+NORMALIZED_ID = "UPPER(REPLACE(REPLACE(REPLACE(national_id, '-', ''), ' ', ''), '/', ''))"
+
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS farmer_name_trgm_idx ON main_farmer USING gin (LOWER(name) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS farmer_national_id_trgm_idx ON main_farmer USING gin (({NORMALIZED_ID}) gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS farmer_name_trgm_idx",
+    "DROP INDEX IF EXISTS farmer_national_id_trgm_idx",
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_backfill_farmer_locations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractUser, Group, Permission
 class CustomUser(AbstractUser):
     ROLE_CHOICES = (
@@ -11,19 +12,54 @@ class CustomUser(AbstractUser):
     groups = models.ManyToManyField(Group, related_name="custom_user_groups", blank=True)
     user_permissions = models.ManyToManyField(Permission, related_name="custom_user_permissions", blank=True)
 
+    def check_password(self, raw_password):
+        # Same as Django's, except an outdated hash is upgraded in the background
+        # (main.hashers) so the login itself only pays for one hash
+        from .hashers import schedule_rehash
+
+        return check_password(raw_password, self.password, lambda raw: schedule_rehash(self, raw))
+
 # Farm Type Model
 class FarmType(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
 
 # Crop Model
 class Crop(models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     name = models.CharField(max_length=255)
     description = models.TextField()
     image = models.ImageField(upload_to='crops/',null=True,blank=True)
+    # Resized WebP copies of image (see main.images.VARIANTS), name -> storage path
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.name
+
+# Reference table behind Farmer.location: one row per place, however clerks
+# spell it. grid_cell is filled from the coordinates (main.locations) so map
+# queries are index range scans.
+class Location(models.Model):
+    name = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, unique=True)  # main.locations.location_key(name)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    grid_cell = models.IntegerField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -35,8 +71,107 @@ class Farmer(models.Model):
         max_length=255,
         default='Harare'  # Default can be set to any town or leave empty
     )
+    # Set from location on every write (main.locations.resolve_locations)
+    location_ref = models.ForeignKey(
+        Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='farmers'
+    )
     farm_type = models.ForeignKey(FarmType, on_delete=models.CASCADE)
     crop = models.ForeignKey(Crop, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Case-insensitive prefix indexes on name/national_id for ?search= are
+        # vendor specific and created in migration 0005.
+        indexes = [
+            models.Index(fields=['location'], name='farmer_location_idx'),
+            models.Index(fields=['farm_type', 'crop'], name='farmer_farm_type_crop_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+# Append-only change log for the delta-sync endpoint. Every save/delete of a
+# synced model adds a row; the autoincrement id is the client's sync cursor and
+# rows with deleted=True are the tombstones.
+class SyncChange(models.Model):
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id']),
+            # Newest change per model: the table version used for ETags
+            models.Index(fields=['model', 'id'], name='syncchange_model_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id} @{self.id}"
+
+# Materialized dashboard counters, kept current by the Farmer signals in
+# main.signals and rebuilt from grouped queries by main.stats.rebuild_farmer_stats.
+class FarmerStat(models.Model):
+    DIMENSION_CHOICES = (
+        ('total', 'Total'),
+        ('farm_type', 'Farm type'),
+        ('crop', 'Crop'),
+        ('location', 'Location'),
+    )
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=255, blank=True)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='unique_farmer_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}:{self.key}={self.count}"
+
+# Reference counts for content-addressed media (main.storage): one row per
+# stored file, counting the file fields that point at it.
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} x{self.refcount}"
+
+# Background job queue (main.tasks), worked by `manage.py run_workers`.
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField()
+    # A running task whose lease has passed belongs to a dead worker and is picked up again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due tasks by status and time
+            models.Index(fields=['status', 'run_after'], name='task_due_idx'),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.name}#{self.id} ({self.status})"
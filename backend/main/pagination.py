@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Opt-in keyset pagination on the primary key.
+
+    Clients that send neither ``cursor`` nor ``page_size`` keep getting the
+    plain unpaginated list. Pages are fetched with ``id > last_seen`` so they
+    cost the same at any depth and stay stable while rows are inserted.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,40 @@
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # The classes below are only registered when it is installed
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+_json_encoder = JSONEncoder()
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """Binary JSON equivalent: same structure, smaller and faster to encode.
+
+    Dates, decimals and the like become the same strings the JSON renderer
+    produces, so clients can switch formats without other changes.
+    """
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_json_encoder.default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise ParseError(f'MessagePack parse error - {e}')
@@ -1,91 +1,178 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import CustomUser, Farmer, FarmType, Crop
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .models import CustomUser, Farmer, FarmType, Crop, Location
 from rest_framework import serializers
 from .models import Crop
-from django.core.files.base import ContentFile
-import base64
-import imghdr
-from io import BytesIO
-from PIL import Image
+from .authentication import user_claims
+from .blacklist import CachedBlacklistRefreshToken
+from .duplicates import find_similar_farmers
+from .locations import location_key
+from .images import InvalidImage, decode_data_uri, prepare_upload, replace_crop_image, schedule_crop_image
+from .sparse import SparseFieldsMixin
+from .uploads import max_image_bytes
 
 
-class UserGetSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = CustomUser
-        fields = '__all__'
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CachedBlacklistRefreshToken
 
+    @classmethod
+    def get_token(cls, user):
+        # Embed the profile so requests can be authenticated from the token alone
+        token = super().get_token(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
 
-class FarmerGetSerializer(serializers.ModelSerializer):
-    farm_type = serializers.StringRelatedField()
-    
-    class Meta:
-        model = Farmer
-        fields = '__all__'
 
-class FarmerPostSerializer(serializers.ModelSerializer):
-    farm_type = serializers.PrimaryKeyRelatedField(queryset=FarmType.objects.all())
-    
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
+
+
+class UserGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
-        model = Farmer
-        fields = '__all__'
-        
-        
+        model = CustomUser
+        fields = [
+            'id', 'username', 'email', 'first_name', 'last_name', 'role', 'is_active', 'is_staff',
+            'is_superuser', 'last_login', 'date_joined', 'password', 'groups', 'user_permissions',
+        ]
+        # The hash is only ever written; groups and permissions are read with ?expand=
+        extra_kwargs = {'password': {'write_only': True}}
+        deferred_fields = ('groups', 'user_permissions')
+
+
 # Serializer for FarmType
-class FarmTypeGetSerializer(serializers.ModelSerializer):
+class FarmTypeGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = FarmType
         fields = '__all__'
 
 # GET Serializer for Crop (includes related objects' details)
-class CropGetSerializer(serializers.ModelSerializer):
+class CropGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Crop
         fields = '__all__'
 
+    def get_image_variants(self, crop):
+        # Resized WebP URLs so list screens don't download the original
+        storage = crop.image.storage
+        request = self.context.get('request')
+        urls = {}
+        for name, path in crop.image_variants.items():
+            url = storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class CropImageField(serializers.Field):
+    """Accepts an uploaded file (multipart or raw body) or, for older
+    clients, a base64 data URI string."""
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str):
+                return decode_data_uri(data, limit=max_image_bytes())
+            if hasattr(data, 'read') and hasattr(data, 'size'):
+                return prepare_upload(data, limit=max_image_bytes())
+        except InvalidImage as e:
+            raise serializers.ValidationError(str(e))
+        raise serializers.ValidationError("Invalid image format.")
+
 
 class CropPostSerializer(serializers.ModelSerializer):
-    image = serializers.CharField(write_only=True)
+    image = CropImageField(write_only=True)
+    # Id of the queued variant job, to poll at /api/tasks/<id>/; null when
+    # nothing was queued (no new image, or CROP_IMAGE_ASYNC is off)
+    image_task = serializers.SerializerMethodField()
 
     class Meta:
         model = Crop
-        fields = ['name', 'description', 'image']
-
-    def validate_image(self, value):
-        # Extract base64 data from 'data:image/webp;base64,...'
-        if not value.startswith('data:image'):
-            raise serializers.ValidationError("Invalid image format.")
-        
-        # Split base64 string into header and data
-        format, imgstr = value.split(';base64,')  # Split into format and base64 string
-        byte_data = base64.b64decode(imgstr)  # Decode base64 data
-
-        # Check image type
-        image_type = imghdr.what(None, byte_data)
-        if image_type not in ['jpeg', 'png', 'webp']:
-            raise serializers.ValidationError("Unsupported image type.")
-
-        # Create a file-like object from the byte data
-        image_file = ContentFile(byte_data, name="uploaded_image." + image_type)
-        return image_file
+        fields = ['name', 'description', 'image', 'image_task']
+
+    def get_image_task(self, crop):
+        job = getattr(crop, 'image_task', None)
+        return job.pk if job else None
 
     def create(self, validated_data):
         image = validated_data.pop('image')  # Extract image data
         crop = Crop.objects.create(**validated_data)
-        crop.image.save(image.name, image, save=True)  # Save the image
+        crop.image.save(image.name, image, save=True)  # Save the original
+        crop.image_task = schedule_crop_image(crop)  # Variants are generated off the request
         return crop
 
+    def update(self, instance, validated_data):
+        image = validated_data.pop('image', None)
+        crop = super().update(instance, validated_data)
+        if image is not None:
+            replace_crop_image(crop, image)
+            crop.image_task = schedule_crop_image(crop)
+        return crop
+
+
+class LocationSerializer(serializers.ModelSerializer):
+    farmer_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Location
+        fields = ['id', 'name', 'latitude', 'longitude', 'farmer_count', 'updated_at']
+
+    def validate_name(self, value):
+        key = location_key(value)
+        if not key:
+            raise serializers.ValidationError("Enter a place name.")
+        clash = Location.objects.filter(key=key).exclude(pk=getattr(self.instance, 'pk', None))
+        if clash.exists():
+            raise serializers.ValidationError("A location with this name already exists.")
+        return ' '.join(value.split())
+
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("Set both latitude and longitude, or neither.")
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise serializers.ValidationError("Coordinates out of range.")
+        return attrs
+
 
 # GET Serializer for Farmer
-class FarmerGetSerializer(serializers.ModelSerializer):
+class FarmerGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     farm_type = FarmTypeGetSerializer()
 
     class Meta:
         model = Farmer
         fields = '__all__'
+        expandable_fields = {'crop': CropGetSerializer}
 
 # POST Serializer for Farmer
 class FarmerPostSerializer(serializers.ModelSerializer):
+    # Set when the clerk has checked the suggested duplicates and this really is someone else
+    allow_duplicate = serializers.BooleanField(write_only=True, required=False, default=False)
+
     class Meta:
         model = Farmer
         fields = '__all__'
+        read_only_fields = ['location_ref']  # Follows location, see main.locations
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs.pop('allow_duplicate', False) or not {'name', 'national_id'} & attrs.keys():
+            return attrs
+        duplicates = find_similar_farmers(
+            attrs.get('name', getattr(self.instance, 'name', '')),
+            attrs.get('national_id', getattr(self.instance, 'national_id', '')),
+            exclude=getattr(self.instance, 'pk', None),
+            limit=5,
+            min_score=getattr(settings, 'FARMER_DUPLICATE_SCORE', 0.85),
+        )
+        if duplicates:
+            raise serializers.ValidationError({
+                'possible_duplicates': [
+                    f"{d['name']} ({d['national_id']}, id {d['id']}) matches with score {d['score']}."
+                    for d in duplicates
+                ],
+                'allow_duplicate': ["Set to true to register this farmer anyway."],
+            })
+        return attrs
@@ -0,0 +1,70 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .images import release_crop_images
+from .locations import grid_cell, location_key, resolve_locations
+from .models import Crop, Farmer, FarmType, Location
+from .stats import DIMENSIONS, apply_farmer_change
+from .sync import record_change
+
+SYNCED_MODELS = (FarmType, Crop, Farmer)
+STAT_FIELDS = list(DIMENSIONS.values())
+
+
+def log_sync_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(instance)
+
+
+def log_sync_delete(sender, instance, **kwargs):
+    record_change(instance, deleted=True)
+
+
+def remember_farmer_stats(sender, instance, raw=False, **kwargs):
+    # Snapshot the stored values so post_save can move the counters
+    previous = None
+    if instance.pk and not raw:
+        previous = Farmer.objects.filter(pk=instance.pk).values(*STAT_FIELDS).first()
+    instance._stats_previous = previous
+
+
+def update_farmer_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        new = {field: getattr(instance, field) for field in STAT_FIELDS}
+        apply_farmer_change(old=getattr(instance, '_stats_previous', None), new=new)
+
+
+def remove_farmer_stats(sender, instance, **kwargs):
+    apply_farmer_change(old={field: getattr(instance, field) for field in STAT_FIELDS})
+
+
+def link_farmer_location(sender, instance, raw=False, **kwargs):
+    # Runs after remember_farmer_stats: only a new or changed location is resolved
+    previous = getattr(instance, '_stats_previous', None)
+    if raw or (previous and previous['location'] == instance.location and instance.location_ref_id):
+        return
+    instance.location_ref_id = resolve_locations([instance.location])[instance.location][0]
+
+
+def index_location(sender, instance, raw=False, **kwargs):
+    instance.key = location_key(instance.name)
+    instance.grid_cell = grid_cell(instance.latitude, instance.longitude)
+
+
+def release_crop_files(sender, instance, **kwargs):
+    release_crop_images(instance)
+
+
+for model in SYNCED_MODELS:
+    post_save.connect(log_sync_save, sender=model, dispatch_uid=f'sync_save_{model._meta.model_name}')
+    post_delete.connect(log_sync_delete, sender=model, dispatch_uid=f'sync_delete_{model._meta.model_name}')
+
+pre_save.connect(index_location, sender=Location, dispatch_uid='location_pre_save_location')
+# Not sent by /api/sync/, but farmer lists filtered by ?bbox= depend on
+# Location coordinates and the response cache keys on the table's version
+post_save.connect(log_sync_save, sender=Location, dispatch_uid='sync_save_location')
+post_delete.connect(log_sync_delete, sender=Location, dispatch_uid='sync_delete_location')
+pre_save.connect(remember_farmer_stats, sender=Farmer, dispatch_uid='stats_pre_save_farmer')
+pre_save.connect(link_farmer_location, sender=Farmer, dispatch_uid='location_pre_save_farmer')
+post_save.connect(update_farmer_stats, sender=Farmer, dispatch_uid='stats_save_farmer')
+post_delete.connect(remove_farmer_stats, sender=Farmer, dispatch_uid='stats_delete_farmer')
+post_delete.connect(release_crop_files, sender=Crop, dispatch_uid='media_delete_crop')
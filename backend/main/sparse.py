@@ -0,0 +1,76 @@
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+def _param_set(request, name):
+    # DRF requests have query_params; the plain Django ones from async_views don't
+    value = getattr(request, 'query_params', request.GET).get(name)
+    return {part.strip() for part in value.split(',') if part.strip()} if value else set()
+
+
+def wants_compact(request):
+    return getattr(request, 'query_params', request.GET).get('compact') in ('1', 'true')
+
+
+class SparseFieldsMixin:
+    """``?fields=a,b`` and ``?expand=x`` for the GET serializers.
+
+    Meta options:
+
+    * ``expandable_fields``: {name: serializer class} for relations sent as ids
+      by default and nested when named in ``?expand=``.
+    * ``deferred_fields``: fields left out of reads unless named in ``?expand=``
+      (they stay writable).
+
+    Only the serializer built by the view (the one given the request context)
+    looks at the query; nested serializers always send all their fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        meta = getattr(self, 'Meta', None)
+        expand = _param_set(request, 'expand')
+        for name, serializer_class in getattr(meta, 'expandable_fields', {}).items():
+            if name in expand:
+                self.fields[name] = serializer_class(read_only=True)
+        for name in getattr(meta, 'deferred_fields', ()):
+            if name not in expand:
+                self.fields.pop(name, None)
+
+        only = _param_set(request, 'fields')
+        if only:
+            for name in list(self.fields):
+                if name not in only:
+                    self.fields.pop(name)
+
+
+class CompactListMixin:
+    """``?compact=1`` lists straight from ``.values()`` rows, skipping the serializer.
+
+    The response is ``{"columns": [...], "results": [[...], ...]}`` (plus
+    ``next``/``previous`` when paginated). ``compact_fields`` maps each output
+    column to an ORM lookup, so relations come out as ids or flattened names;
+    ``?fields=`` picks a subset of the columns.
+    """
+    compact_fields = {}
+
+    def list(self, request, *args, **kwargs):
+        if not wants_compact(request):
+            return super().list(request, *args, **kwargs)
+        only = _param_set(request, 'fields')
+        columns = [name for name in self.compact_fields if not only or name in only] or list(self.compact_fields)
+        lookups = [self.compact_fields[name] for name in columns]
+
+        queryset = self.filter_queryset(self.get_queryset()).values(*{*lookups, 'id'})
+        page = self.paginate_queryset(queryset)
+        rows = [[row[lookup] for lookup in lookups] for row in (page if page is not None else queryset)]
+        if page is not None:
+            response = self.get_paginated_response(rows)
+            response.data['columns'] = columns
+            return response
+        return Response({'columns': columns, 'results': rows})
+
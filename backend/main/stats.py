@@ -0,0 +1,123 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Crop, CustomUser, Farmer, FarmerStat, FarmType
+
+# FarmerStat dimension -> Farmer field it groups on
+DIMENSIONS = {
+    'farm_type': 'farm_type_id',
+    'crop': 'crop_id',
+    'location': 'location',
+}
+
+
+def farmer_keys(values):
+    # (dimension, key) pairs a farmer with these field values is counted under
+    keys = [('total', '')]
+    for dimension, field in DIMENSIONS.items():
+        keys.append((dimension, str(values[field])))
+    return keys
+
+
+def bump(dimension, key, delta):
+    updated = FarmerStat.objects.filter(dimension=dimension, key=key).update(count=F('count') + delta)
+    if not updated and delta > 0:
+        FarmerStat.objects.get_or_create(dimension=dimension, key=key)
+        FarmerStat.objects.filter(dimension=dimension, key=key).update(count=F('count') + delta)
+
+
+def apply_farmer_change(old=None, new=None):
+    """Move one farmer's contribution from ``old`` to ``new`` field values."""
+    old_keys = set(farmer_keys(old)) if old else set()
+    new_keys = set(farmer_keys(new)) if new else set()
+    with transaction.atomic():
+        for dimension, key in old_keys - new_keys:
+            bump(dimension, key, -1)
+        for dimension, key in new_keys - old_keys:
+            bump(dimension, key, 1)
+
+
+def apply_farmer_changes(changes):
+    """``apply_farmer_change`` for a batch of (old, new) pairs, e.g. a bulk upsert.
+
+    Deltas are summed first, so the cost is one update per counter touched,
+    not per farmer, and never depends on the size of the registry.
+    """
+    deltas = Counter()
+    for old, new in changes:
+        old_keys = set(farmer_keys(old)) if old else set()
+        new_keys = set(farmer_keys(new)) if new else set()
+        deltas.subtract(old_keys - new_keys)
+        deltas.update(new_keys - old_keys)
+    with transaction.atomic():
+        for (dimension, key), delta in sorted(deltas.items()):
+            if delta:
+                bump(dimension, key, delta)
+
+
+def rebuild_farmer_stats():
+    """Recompute every counter with grouped queries, e.g. after bulk writes."""
+    rows = [FarmerStat(dimension='total', key='', count=Farmer.objects.count())]
+    for dimension, field in DIMENSIONS.items():
+        grouped = Farmer.objects.order_by().values(field).annotate(total=Count('id'))
+        rows += [FarmerStat(dimension=dimension, key=str(g[field]), count=g['total']) for g in grouped]
+    with transaction.atomic():
+        FarmerStat.objects.all().delete()
+        FarmerStat.objects.bulk_create(rows)
+
+
+def _stat_queries():
+    # The four queries behind the dashboard, shared by the sync and async views
+    return (
+        FarmerStat.objects.filter(count__gt=0).values_list('dimension', 'key', 'count'),
+        FarmType.objects.values_list('id', 'name'),
+        Crop.objects.values_list('id', 'name'),
+        CustomUser.objects.order_by().values_list('role').annotate(total=Count('id')),
+    )
+
+
+def _format_stats(stat_rows, farm_types, crops, roles):
+    counters = {}
+    for dimension, key, count in stat_rows:
+        counters.setdefault(dimension, {})[key] = count
+
+    def by_name(dimension, names):
+        counts = counters.get(dimension, {})
+        return [
+            {'id': pk, 'name': name, 'count': counts.get(str(pk), 0)}
+            for pk, name in sorted(names.items())
+        ]
+
+    return {
+        'totals': {
+            'farmers': counters.get('total', {}).get('', 0),
+            'farm_types': len(farm_types),
+            'crops': len(crops),
+            'users': sum(roles.values()),
+            'clerks': roles.get('clerk', 0),
+            'admins': roles.get('admin', 0),
+        },
+        'by_farm_type': by_name('farm_type', farm_types),
+        'by_crop': by_name('crop', crops),
+        'by_location': [
+            {'location': location, 'count': count}
+            for location, count in sorted(counters.get('location', {}).items())
+        ],
+    }
+
+
+def dashboard_stats():
+    stat_rows, farm_types, crops, roles = _stat_queries()
+    return _format_stats(list(stat_rows), dict(farm_types), dict(crops), dict(roles))
+
+
+async def adashboard_stats():
+    stat_rows, farm_types, crops, roles = _stat_queries()
+    return _format_stats(
+        [row async for row in stat_rows],
+        {pk: name async for pk, name in farm_types},
+        {pk: name async for pk, name in crops},
+        {role: total async for role, total in roles},
+    )
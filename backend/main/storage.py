@@ -0,0 +1,83 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# <upload_to>/<first two hex digits>/<sha256>.<ext>
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)([0-9a-f]{2})/(\2[0-9a-f]{62})(\.[a-z0-9]+)?$')
+
+
+def content_digest(name):
+    """The sha256 a content-addressed name was stored under, or None for other names."""
+    match = CONTENT_ADDRESSED_NAME.search(name)
+    return match.group(3) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage that keeps each distinct file once, named by its sha256.
+
+    ``save`` hashes the content and stores it as
+    ``<dir>/<ab>/<sha256>.<ext>``; saving identical bytes again (the same
+    stock photo for twenty crops) only bumps the MediaBlob reference count.
+    ``delete`` drops one reference and removes the file with the last one.
+    Since a name always means the same bytes, files can be served as
+    immutable (see main.media).
+
+    Files stored before this storage existed have no MediaBlob row; they had a
+    single owner, so deleting one removes it.
+    """
+
+    def save(self, name, content, max_length=None):
+        from .models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(self.generate_filename(name)), digest[:2], digest + extension)
+
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    blob, _ = MediaBlob.objects.get_or_create(name=name, defaults={'size': content.size})
+                    MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+                break
+            except IntegrityError:
+                continue  # Another request created the row first; count on it instead
+
+        if not self.exists(name):
+            written = self._save(name, content)
+            if written != name:
+                # Lost a race with an identical write; the bytes are already there
+                super().delete(written)
+        return name
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        if not name:
+            return
+        if MediaBlob.objects.filter(name=name, refcount__gt=1).update(refcount=F('refcount') - 1):
+            return
+        deleted, _ = MediaBlob.objects.filter(name=name).delete()
+        if not deleted and content_digest(name) is None:
+            super().delete(name)  # Saved before content addressing, single owner
+            return
+
+        def remove_file():
+            # Unless the same bytes were saved again meanwhile
+            if not MediaBlob.objects.filter(name=name).exists():
+                super(ContentAddressedStorage, self).delete(name)
+
+        transaction.on_commit(remove_file)
@@ -0,0 +1,93 @@
+from django.conf import settings
+
+from .models import Crop, Farmer, FarmType, SyncChange
+from .serializers import CropGetSerializer, FarmerGetSerializer, FarmTypeGetSerializer
+
+# Models exposed through /api/sync/, keyed by the name used in the response
+SYNC_MODELS = {
+    'farm_types': (FarmType, FarmTypeGetSerializer),
+    'crops': (Crop, CropGetSerializer),
+    'farmers': (Farmer, FarmerGetSerializer),
+}
+
+DEFAULT_SYNC_LIMIT = 1000
+MAX_SYNC_LIMIT = 5000
+
+
+def record_change(instance, deleted=False):
+    SyncChange.objects.create(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        deleted=deleted,
+    )
+
+
+def record_changes(model, ids, deleted=False):
+    # Bulk writes (bulk_create/update) skip model signals, so callers log them here
+    SyncChange.objects.bulk_create(
+        SyncChange(model=model._meta.model_name, object_id=pk, deleted=deleted)
+        for pk in ids
+    )
+
+
+def _queryset(model):
+    queryset = model.objects.all()
+    if model is Farmer:
+        queryset = queryset.select_related('farm_type', 'crop')
+    return queryset
+
+
+def current_cursor():
+    last = SyncChange.objects.order_by('-id').values_list('id', flat=True).first()
+    return last or 0
+
+
+def full_snapshot(context=None):
+    # Read the cursor before the rows: anything committed in between is sent
+    # again on the next sync, which is harmless because clients upsert by id.
+    cursor = current_cursor()
+    payload = {'cursor': cursor, 'full': True, 'has_more': False}
+    for key, (model, serializer_class) in SYNC_MODELS.items():
+        rows = serializer_class(_queryset(model), many=True, context=context).data
+        payload[key] = {'updated': rows, 'deleted': []}
+    return payload
+
+
+def cursor_overlap():
+    return getattr(settings, 'SYNC_CURSOR_OVERLAP', 100)
+
+
+def changes_since(since, limit=DEFAULT_SYNC_LIMIT, context=None):
+    # Ids are handed out at insert, so a slow transaction can commit a lower
+    # id after a client synced past it: re-read the last SYNC_CURSOR_OVERLAP
+    # ids too. Their objects are sent again, clients upsert them by id.
+    overlap = cursor_overlap()
+    rows = list(
+        SyncChange.objects.filter(id__gt=max(since - overlap, 0))
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'deleted')[:limit + overlap]
+    )
+    new = [row for row in rows if row[0] > since][:limit]
+    changes = [row for row in rows if row[0] <= since] + new
+
+    # Collapse the window to the latest state of each object
+    latest = {}
+    for _, model_name, object_id, deleted in changes:
+        latest.setdefault(model_name, {})[object_id] = deleted
+
+    payload = {
+        'cursor': new[-1][0] if new else since,
+        'full': False,
+        'has_more': len(new) == limit,
+    }
+    for key, (model, serializer_class) in SYNC_MODELS.items():
+        states = latest.get(model._meta.model_name, {})
+        live_ids = [pk for pk, deleted in states.items() if not deleted]
+        objects = _queryset(model).in_bulk(live_ids)
+        # Rows changed and then deleted after this window are tombstones too
+        deleted_ids = sorted(pk for pk in states if pk not in objects)
+        rows = serializer_class(
+            [objects[pk] for pk in sorted(objects)], many=True, context=context
+        ).data
+        payload[key] = {'updated': rows, 'deleted': deleted_ids}
+    return payload
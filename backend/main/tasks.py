@@ -0,0 +1,131 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Task name -> (function, max_attempts, retry_delay seconds)
+_registry = {}
+
+
+def task(name, max_attempts=3, retry_delay=10):
+    """Register a function as a queued task under ``name``.
+
+    Arguments must be JSON-serializable; they are stored in the Task row.
+    Never pass secrets such as raw passwords.
+    """
+    def register(func):
+        _registry[name] = (func, max_attempts, retry_delay)
+        return func
+    return register
+
+
+def enqueue(name, *args, delay=0, **kwargs):
+    """Queue a registered task and return its Task row.
+
+    The row is written in the caller's transaction, so workers only see the
+    task once the request's changes are committed.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown task {name!r}")
+    _, max_attempts, _ = _registry[name]
+    return Task.objects.create(
+        name=name, args=list(args), kwargs=kwargs, max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 300))
+
+
+def claim_next():
+    """Atomically take the oldest due task, or return None.
+
+    Claiming is a compare-and-set UPDATE on (status, attempts), so any number
+    of worker processes can poll the same table without a broker or row
+    locks. Running tasks whose lease expired (their worker died) are due
+    again, or failed once they are out of attempts.
+    """
+    now = timezone.now()
+    due = (
+        Task.objects.filter(Q(status=Task.QUEUED, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now))
+        .order_by('run_after', 'id')
+        .values_list('id', 'status', 'attempts', 'max_attempts')[:20]
+    )
+    for task_id, status, attempts, max_attempts in due:
+        current = Task.objects.filter(id=task_id, status=status, attempts=attempts)
+        if status == Task.RUNNING and attempts >= max_attempts:
+            current.update(status=Task.FAILED, locked_until=None, updated_at=now,
+                           last_error='Worker stopped before finishing.')
+            continue
+        if current.update(status=Task.RUNNING, attempts=F('attempts') + 1, locked_until=now + _lease(), updated_at=now):
+            return Task.objects.get(id=task_id)
+    return None
+
+
+def execute(task_row):
+    """Run a claimed task and record the outcome (done, retry later, or failed)."""
+    func, _, retry_delay = _registry.get(task_row.name, (None, 0, 0))
+    try:
+        if func is None:
+            raise KeyError(f"Unknown task {task_row.name!r}")
+        result = func(*task_row.args, **task_row.kwargs)
+    except Exception as e:
+        logger.exception("Task %s failed (attempt %s/%s)", task_row, task_row.attempts, task_row.max_attempts)
+        update = {'locked_until': None, 'last_error': f'{type(e).__name__}: {e}'}
+        if func is not None and task_row.attempts < task_row.max_attempts:
+            # Exponential backoff: retry_delay, 2x, 4x, ...
+            backoff = retry_delay * 2 ** (task_row.attempts - 1)
+            update.update(status=Task.QUEUED, run_after=timezone.now() + timedelta(seconds=backoff))
+        else:
+            update['status'] = Task.FAILED
+    else:
+        update = {'status': Task.DONE, 'locked_until': None, 'result': result, 'last_error': ''}
+    Task.objects.filter(id=task_row.id).update(updated_at=timezone.now(), **update)
+
+
+def run_due_tasks(stop=None):
+    """Execute tasks until none is due (or ``stop`` is set); returns how many ran."""
+    executed = 0
+    while stop is None or not stop.is_set():
+        task_row = claim_next()
+        if task_row is None:
+            break
+        execute(task_row)
+        executed += 1
+    return executed
+
+
+def run_worker(stop, poll_interval=1.0, burst=False):
+    """Worker process loop: poll for due tasks until ``stop`` (an Event) is set.
+
+    With ``burst`` it returns as soon as nothing is due.
+    """
+    while not stop.is_set():
+        close_old_connections()
+        run_due_tasks(stop)
+        if burst:
+            break
+        stop.wait(poll_interval)
+    close_old_connections()
+
+
+def task_status(task_row):
+    return {
+        'id': task_row.id,
+        'name': task_row.name,
+        'status': task_row.status,
+        'attempts': task_row.attempts,
+        'max_attempts': task_row.max_attempts,
+        'result': task_row.result,
+        'error': task_row.last_error or None,
+        'created_at': task_row.created_at,
+        'updated_at': task_row.updated_at,
+    }
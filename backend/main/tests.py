@@ -1,3 +1,1642 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import hashers, images
+from .authentication import clear_token_cache
+from .blacklist import blacklisted
+from .cache import reset_cache_stats
+from .duplicates import find_similar_farmers, rebuild_similarity_index
+from .filters import filter_farmers
+from .images import schedule_crop_image
+from .locations import bbox_query, grid_cell, nearest_locations
+from .metrics import reset_metrics
+from .models import Crop, CustomUser, Farmer, FarmType, Location, MediaBlob, SyncChange, Task
+from .stats import rebuild_farmer_stats
+from .tasks import enqueue, run_due_tasks, task
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class BaseTestCase(TestCase):
+    """Starts every test with empty caches; the database is rolled back but caches aren't."""
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        reset_cache_stats()
+        blacklisted.clear()
+
+
+def make_farm_type(name='Commercial'):
+    return FarmType.objects.create(name=name, description=f'{name} farming')
+
+
+def make_crop(name='Maize'):
+    return Crop.objects.create(name=name, description=f'{name} crop')
+
+
+def make_farmer(farm_type, crop, national_id='63-123456A00', name='Tendai Moyo', location='Harare'):
+    return Farmer.objects.create(
+        name=name, national_id=national_id, location=location, farm_type=farm_type, crop=crop
+    )
+
+
+class SyncTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type = make_farm_type()
+        self.crop = make_crop()
+        self.farmer = make_farmer(self.farm_type, self.crop)
+
+    def test_full_snapshot_without_cursor(self):
+        response = self.client.get('/api/sync/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['full'])
+        self.assertEqual(response.data['cursor'], SyncChange.objects.latest('id').id)
+        self.assertEqual([f['id'] for f in response.data['farmers']['updated']], [self.farmer.id])
+
+    @override_settings(SYNC_CURSOR_OVERLAP=0)
+    def test_changes_since_cursor(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        self.farmer.name = 'Tendai M. Moyo'
+        self.farmer.save()
+        other = make_crop('Tobacco')
+        other_id = other.id
+        other.delete()
+
+        response = self.client.get('/api/sync/', {'since': cursor})
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['farmers']['updated'][0]['name'], 'Tendai M. Moyo')
+        self.assertEqual(response.data['crops']['updated'], [])
+        self.assertEqual(response.data['crops']['deleted'], [other_id])
+        self.assertEqual(response.data['farm_types'], {'updated': [], 'deleted': []})
+
+        # Nothing new after catching up
+        response = self.client.get('/api/sync/', {'since': response.data['cursor']})
+        self.assertEqual(response.data['farmers'], {'updated': [], 'deleted': []})
+
+    def test_cascade_delete_is_tombstoned(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        farm_type_id, farmer_id = self.farm_type.id, self.farmer.id
+        self.farm_type.delete()
+        response = self.client.get('/api/sync/', {'since': cursor})
+        self.assertEqual(response.data['farm_types']['deleted'], [farm_type_id])
+        self.assertEqual(response.data['farmers']['deleted'], [farmer_id])
+
+    @override_settings(SYNC_CURSOR_OVERLAP=0)
+    def test_limit_pages_through_changes(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        for name in ('Sorghum', 'Wheat', 'Cotton'):
+            make_crop(name)
+        response = self.client.get('/api/sync/', {'since': cursor, 'limit': 2})
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(len(response.data['crops']['updated']), 2)
+        response = self.client.get('/api/sync/', {'since': response.data['cursor'], 'limit': 2})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual([c['name'] for c in response.data['crops']['updated']], ['Cotton'])
+
+    def test_late_commit_below_cursor_is_not_skipped(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        late = make_crop('Sorghum')
+        make_crop('Wheat')
+        # The Sorghum change is still uncommitted while the client syncs past it
+        pending = SyncChange.objects.get(model='crop', object_id=late.id).id
+        SyncChange.objects.filter(id=pending).delete()
+        response = self.client.get('/api/sync/', {'since': cursor})
+        self.assertNotIn('Sorghum', [c['name'] for c in response.data['crops']['updated']])
+        self.assertGreater(response.data['cursor'], pending)
+
+        SyncChange.objects.create(id=pending, model='crop', object_id=late.id)
+        response = self.client.get('/api/sync/', {'since': response.data['cursor']})
+        self.assertIn('Sorghum', [c['name'] for c in response.data['crops']['updated']])
+
+    def test_overlap_does_not_stall_paging(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        for name in ('Sorghum', 'Wheat', 'Cotton'):
+            make_crop(name)
+        seen = set()
+        for _ in range(3):
+            response = self.client.get('/api/sync/', {'since': cursor, 'limit': 1})
+            seen.update(c['name'] for c in response.data['crops']['updated'])
+            cursor = response.data['cursor']
+        self.assertLessEqual({'Sorghum', 'Wheat', 'Cotton'}, seen)
+        self.assertEqual(cursor, SyncChange.objects.latest('id').id)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sync/', {'since': -1}).status_code, 400)
+
+
+class FarmerBulkUpsertTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type = make_farm_type()
+        self.crop = make_crop()
+        self.existing = make_farmer(self.farm_type, self.crop, national_id='11-000001A11')
+
+    def row(self, national_id, **overrides):
+        return {
+            'name': 'Rudo Chikomo',
+            'national_id': national_id,
+            'location': 'Mutare',
+            'farm_type': self.farm_type.id,
+            'crop': self.crop.id,
+            **overrides,
+        }
+
+    def test_creates_and_updates_by_national_id(self):
+        rows = [self.row('11-000001A11', name='Renamed'), self.row('22-000002B22'), self.row('33-000003C33')]
+        response = self.client.post('/api/farmers/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 1))
+        self.assertEqual(response.data['results'][0]['id'], self.existing.id)
+        self.assertEqual(Farmer.objects.get(id=self.existing.id).name, 'Renamed')
+        self.assertEqual(Farmer.objects.count(), 3)
+
+    def test_per_row_errors_do_not_block_batch(self):
+        rows = [self.row('44-000004D44', crop=9999), self.row('55-000005E55'), {'name': 'No id'}]
+        response = self.client.post('/api/farmers/bulk/', {'farmers': rows}, format='json')
+        statuses = [r['status'] for r in response.data['results']]
+        self.assertEqual(statuses, ['error', 'created', 'error'])
+        self.assertIn('crop', response.data['results'][0]['errors'])
+        self.assertTrue(Farmer.objects.filter(national_id='55-000005E55').exists())
+
+    def test_duplicates_in_batch_last_wins(self):
+        rows = [self.row('66-000006F66', name='First'), self.row('66-000006F66', name='Second')]
+        response = self.client.post('/api/farmers/bulk/', rows, format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], ['skipped', 'created'])
+        self.assertEqual(Farmer.objects.get(national_id='66-000006F66').name, 'Second')
+
+    def test_constant_queries_across_chunks(self):
+        rows = [self.row(f'77-{i:06d}G77') for i in range(40)]
+        with self.settings(FARMER_BULK_CHUNK_SIZE=20):
+            # 2 id-set loads + per chunk: savepoint pair, location lookup, lookup, upsert,
+            # id fetch, change log, savepoint pair and one update per counter touched
+            # (total, farm type, crop, location) + creating the new 'Mutare' counter once
+            with self.assertNumQueries(2 + 2 * 13 + 5):
+                response = self.client.post('/api/farmers/bulk/', rows, format='json')
+        self.assertEqual(response.data['created'], 40)
+
+    @override_settings(SYNC_CURSOR_OVERLAP=0)
+    def test_upserts_are_logged_for_sync(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        self.client.post('/api/farmers/bulk/', [self.row('88-000008H88')], format='json')
+        response = self.client.get('/api/sync/', {'since': cursor})
+        self.assertEqual([f['national_id'] for f in response.data['farmers']['updated']], ['88-000008H88'])
+
+    def test_rejects_non_list(self):
+        response = self.client.post('/api/farmers/bulk/', {'farmers': 'nope'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryCountTests(BaseTestCase):
+    """List/retrieve endpoints must issue a constant number of queries."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.group = Group.objects.create(name='clerks')
+        self.permission = Permission.objects.first()
+
+    def add_rows(self, start, count):
+        for i in range(start, start + count):
+            farm_type = make_farm_type(f'Type {i}')
+            crop = make_crop(f'Crop {i}')
+            make_farmer(farm_type, crop, national_id=f'{i:02d}-000000X00')
+            user = CustomUser.objects.create_user(username=f'clerk{i}', role='clerk')
+            user.groups.add(self.group)
+            user.user_permissions.add(self.permission)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_rows(0, 1)
+        small = self.count_queries(url)
+        self.add_rows(1, 15)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_farmer_list(self):
+        self.assert_constant_queries('/api/farmers/')
+
+    def test_crop_list(self):
+        self.assert_constant_queries('/api/crops/')
+
+    def test_farm_type_list(self):
+        self.assert_constant_queries('/api/farm-types/')
+
+    def test_user_list(self):
+        self.assert_constant_queries('/api/users/')
+
+    def test_user_list_expanded(self):
+        self.assert_constant_queries('/api/users/?expand=groups,user_permissions')
+
+    def test_farmer_list_expanded(self):
+        self.assert_constant_queries('/api/farmers/?expand=crop')
+
+    def test_farmer_retrieve_is_one_row_query(self):
+        self.add_rows(0, 1)
+        farmer = Farmer.objects.get()
+        with self.assertNumQueries(2):  # The response cache's table versions, then the farmer
+            response = self.client.get(f'/api/farmers/{farmer.id}/')
+        self.assertEqual(response.data['farm_type']['name'], 'Type 0')
+
+    def test_sync_snapshot(self):
+        self.assert_constant_queries('/api/sync/')
+
+
+class KeysetPaginationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.crops = [make_crop(f'Crop {i}') for i in range(5)]
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/crops/')
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 5)
+
+    def test_pages_follow_next_cursor(self):
+        response = self.client.get('/api/crops/', {'page_size': 2})
+        self.assertEqual([c['id'] for c in response.data['results']], [c.id for c in self.crops[:2]])
+
+        seen = [c['id'] for c in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [c['id'] for c in response.data['results']]
+        self.assertEqual(seen, [c.id for c in self.crops])
+
+    def test_stable_under_concurrent_inserts(self):
+        response = self.client.get('/api/crops/', {'page_size': 3})
+        make_crop('Late arrival')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [c['name'] for c in response.data['results']], ['Crop 3', 'Crop 4', 'Late arrival']
+        )
+
+    def test_paginates_every_viewset(self):
+        farm_type = make_farm_type()
+        make_farmer(farm_type, self.crops[0])
+        CustomUser.objects.create_user(username='clerk')
+        for url in ('/api/farmers/', '/api/farm-types/', '/api/users/'):
+            response = self.client.get(url, {'page_size': 1})
+            self.assertEqual(len(response.data['results']), 1, url)
+
+
+class FarmerFilterTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.commercial, self.communal = make_farm_type('Commercial'), make_farm_type('Communal')
+        self.maize, self.tobacco = make_crop('Maize'), make_crop('Tobacco')
+        make_farmer(self.commercial, self.maize, '63-111111A11', 'Tendai Moyo', 'Harare')
+        make_farmer(self.commercial, self.tobacco, '08-222222B22', 'Rudo Ncube', 'Bulawayo')
+        make_farmer(self.communal, self.tobacco, '63-333333C33', 'Farai Tendai', 'Harare')
+
+    def names(self, **params):
+        response = self.client.get('/api/farmers/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(f['name'] for f in response.data)
+
+    def test_filters(self):
+        self.assertEqual(self.names(location='Harare'), ['Farai Tendai', 'Tendai Moyo'])
+        self.assertEqual(self.names(farm_type=self.commercial.id, crop=self.tobacco.id), ['Rudo Ncube'])
+        self.assertEqual(self.names(location='Harare', crop=self.tobacco.id), ['Farai Tendai'])
+
+    def test_search_prefix_and_contains(self):
+        self.assertEqual(self.names(search='tendai'), ['Tendai Moyo'])
+        self.assertEqual(self.names(search='63-'), ['Farai Tendai', 'Tendai Moyo'])
+        self.assertEqual(self.names(search='tendai', match='contains'), ['Farai Tendai', 'Tendai Moyo'])
+
+    def test_invalid_id_filter(self):
+        self.assertEqual(self.client.get('/api/farmers/', {'crop': 'maize'}).status_code, 400)
+
+    def test_filters_use_indexes(self):
+        cases = [
+            ({'location': 'Harare'}, 'farmer_location_idx'),
+            ({'farm_type': self.commercial.id, 'crop': self.maize.id}, 'farmer_farm_type_crop_idx'),
+            ({'search': 'ten'}, 'farmer_name_prefix_idx'),
+        ]
+        for params, index in cases:
+            queryset = filter_farmers(Farmer.objects.all(), params)
+            self.assertIn(index, queryset.explain(), params)
+
+
+class DuplicateDetectionTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type = make_farm_type()
+        self.crop = make_crop()
+        self.farmer = make_farmer(self.farm_type, self.crop, national_id='63-123456A00', name='Tendai Moyo')
+        make_farmer(self.farm_type, self.crop, national_id='08-998877K11', name='Rudo Chikomo')
+
+    def row(self, **overrides):
+        return {'name': 'Tendayi Moyo', 'national_id': '63-123465A00', 'location': 'Harare',
+                'farm_type': self.farm_type.id, 'crop': self.crop.id, **overrides}
+
+    def test_ranks_near_matches(self):
+        results = find_similar_farmers('Tendayi Moyo', '63 123456 a00')
+        self.assertEqual([r['id'] for r in results], [self.farmer.id])
+        self.assertEqual(results[0]['national_id_score'], 1.0)
+        self.assertGreater(results[0]['name_score'], 0.9)
+        # Swapped name order still matches
+        self.assertEqual(find_similar_farmers('Moyo Tendai')[0]['name_score'], 1.0)
+        self.assertEqual(find_similar_farmers('Farai Ndlovu', '11-000000Z99'), [])
+
+    def test_index_follows_writes(self):
+        self.farmer.name = 'Chipo Banda'
+        self.farmer.save()
+        self.assertEqual(find_similar_farmers('Tendai Moyo'), [])
+        self.assertEqual(find_similar_farmers('Chipo Bnda')[0]['id'], self.farmer.id)
+        # Bulk upserts skip model signals; the index triggers still see them
+        self.client.post('/api/farmers/bulk/', [self.row(name='Nyasha Gumbo', national_id='70-111222B33')],
+                         format='json')
+        self.assertEqual(find_similar_farmers('Nyasha Gunbo')[0]['national_id'], '70-111222B33')
+        self.farmer.delete()
+        self.assertEqual(find_similar_farmers('Chipo Banda'), [])
+        self.assertTrue(rebuild_similarity_index())
+        self.assertEqual(len(find_similar_farmers('Rudo Chikomo')), 1)
+
+    @override_settings(FARMER_SIMILAR_CANDIDATES=1)
+    def test_fallback_without_similarity_index(self):
+        with mock.patch('main.duplicates.has_similarity_index', return_value=False):
+            # A typo in the first letters and a differently written ID still match
+            results = find_similar_farmers('Tandai Moyo', '63/123456-a00')
+            self.assertEqual([r['id'] for r in results], [self.farmer.id])
+            # Candidates sharing the most chunks come first, not the lowest ids
+            Farmer.objects.filter(pk=self.farmer.pk).update(name='Rudo Banda')
+            self.assertEqual(find_similar_farmers('Rudo Chikoma')[0]['name'], 'Rudo Chikomo')
+
+    def test_similar_endpoint(self):
+        response = self.client.get('/api/farmers/similar/', {'name': 'Tendai Moyo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], self.farmer.id)
+        response = self.client.get('/api/farmers/similar/', {'name': 'Tendai Moyo', 'exclude': self.farmer.id})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(self.client.get('/api/farmers/similar/').status_code, 400)
+        self.assertEqual(self.client.get('/api/farmers/similar/', {'name': 'x', 'limit': 'a'}).status_code, 400)
+
+    def test_create_rejects_likely_duplicates(self):
+        response = self.client.post('/api/farmers/', self.row(), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Tendai Moyo', response.data['possible_duplicates'][0])
+        self.assertEqual(Farmer.objects.count(), 2)
+
+        response = self.client.post('/api/farmers/', self.row(allow_duplicate=True), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('allow_duplicate', response.data)
+
+    def test_edit_does_not_match_itself(self):
+        response = self.client.patch(f'/api/farmers/{self.farmer.id}/', {'name': 'Tendai Moyo'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'/api/farmers/{self.farmer.id}/', {'location': 'Gweru'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class LocationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type = make_farm_type()
+        self.crop = make_crop()
+        self.harare = Location.objects.get(name='Harare')  # Created with coordinates by migration 0014
+
+    def test_spellings_share_one_location(self):
+        first = make_farmer(self.farm_type, self.crop, '63-111111A11', location='Harare')
+        second = make_farmer(self.farm_type, self.crop, '63-222222B22', location=' HARARE ')
+        self.assertEqual({first.location_ref_id, second.location_ref_id}, {self.harare.id})
+        self.assertEqual(second.location, ' HARARE ')  # What the clerk typed is kept
+
+        new = make_farmer(self.farm_type, self.crop, '63-333333C33', location='Nyanga  Village')
+        self.assertEqual((new.location_ref.name, new.location_ref.key), ('Nyanga Village', 'nyanga village'))
+        self.assertIsNone(new.location_ref.grid_cell)
+        new.location = 'nyanga-village'
+        new.save()
+        self.assertEqual(Location.objects.filter(key='nyanga village').count(), 1)
+
+    def test_location_resolved_only_when_changed(self):
+        farmer = make_farmer(self.farm_type, self.crop, '63-111111A11', location='Harare')
+        farmer.name = 'Tendai Moyo'
+        with CaptureQueriesContext(connection) as queries:
+            farmer.save()
+        self.assertFalse([q for q in queries if 'main_location' in q['sql']])
+        farmer.location = 'Mutare'
+        farmer.save()
+        self.assertEqual(farmer.location_ref.name, 'Mutare')
+
+    def test_bulk_writes_link_locations(self):
+        rows = [{'name': 'Rudo Chikomo', 'national_id': '22-000002B22', 'location': 'mutare',
+                 'farm_type': self.farm_type.id, 'crop': self.crop.id}]
+        self.client.post('/api/farmers/bulk/', rows, format='json')
+        self.assertEqual(Farmer.objects.get().location_ref.name, 'Mutare')
+
+    def test_backfill_migration(self):
+        import importlib
+        from django.apps import apps
+        backfill = importlib.import_module('main.migrations.0014_backfill_farmer_locations')
+
+        make_farmer(self.farm_type, self.crop, '63-111111A11', location='harare')
+        make_farmer(self.farm_type, self.crop, '63-222222B22', location='Rusape')
+        Farmer.objects.update(location_ref=None)
+        Location.objects.filter(name='Rusape').delete()
+        with mock.patch.object(backfill, 'BATCH_SIZE', 1):
+            backfill.backfill_locations(apps, None)
+        self.assertEqual(
+            dict(Farmer.objects.values_list('national_id', 'location_ref__name')),
+            {'63-111111A11': 'Harare', '63-222222B22': 'Rusape'},
+        )
+
+    def test_farmer_filters(self):
+        make_farmer(self.farm_type, self.crop, '63-111111A11', name='Tendai Moyo', location='Harare')
+        make_farmer(self.farm_type, self.crop, '08-222222B22', name='Rudo Ncube', location='Bulawayo')
+        names = lambda **params: [f['name'] for f in self.client.get('/api/farmers/', params).data]
+        self.assertEqual(names(location_id=self.harare.id), ['Tendai Moyo'])
+        self.assertEqual(names(bbox='30.5,-18.5,31.5,-17.5'), ['Tendai Moyo'])
+        self.assertEqual(names(bbox='25,-21,33,-15'), ['Tendai Moyo', 'Rudo Ncube'])
+        self.assertEqual(self.client.get('/api/farmers/', {'bbox': '1,2,3'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/farmers/', {'bbox': '31,-17,30,-18'}).status_code, 400)
+
+    def test_bbox_uses_grid_index(self):
+        response = self.client.get('/api/locations/', {'bbox': '30.5,-18.5,32,-17'})
+        self.assertEqual([l['name'] for l in response.data], ['Bindura', 'Harare', 'Marondera'])
+        plan = Location.objects.filter(bbox_query((-18.5, 30.5, -17, 32))).explain()
+        self.assertIn('grid_cell', plan)
+
+    def test_district_counts(self):
+        make_farmer(self.farm_type, self.crop, '63-111111A11', location='Harare')
+        make_farmer(self.farm_type, self.crop, '63-222222B22', location='harare')
+        data = self.client.get(f'/api/locations/{self.harare.id}/').data
+        self.assertEqual((data['name'], data['farmer_count']), ('Harare', 2))
+
+    def test_nearest(self):
+        response = self.client.get('/api/locations/nearest/', {'lat': -17.9, 'lon': 31.1, 'limit': 3})
+        results = response.data['results']
+        self.assertEqual([r['name'] for r in results], ['Harare', 'Marondera', 'Bindura'])
+        self.assertLess(results[0]['distance_km'], 10)
+        self.assertEqual(self.client.get('/api/locations/nearest/', {'lat': 'x', 'lon': 1}).status_code, 400)
+        # Far from everything: nothing within max_km
+        self.assertEqual(nearest_locations(40.0, -100.0, max_km=100), [])
+
+    def test_nearest_near_the_pole_stops_at_max_km(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(nearest_locations(80.0, 20.0), [])
+        # 500 km is 18 grid rows: radius 1, 2, 4, 8, 16 then 18
+        self.assertEqual(len(queries), 6)
+        self.assertLess(sum(len(q['sql']) for q in queries), 20000)
+
+    def test_nearest_matches_brute_force(self):
+        point = (-19.0, 29.0)
+        located = Location.objects.exclude(latitude=None)
+        expected = sorted(located, key=lambda l: (l.latitude - point[0]) ** 2 + (l.longitude - point[1]) ** 2)
+        self.assertEqual([l.name for l in nearest_locations(*point, limit=4)], [l.name for l in expected[:4]])
+
+    def test_editing_coordinates_updates_grid(self):
+        response = self.client.post('/api/locations/', {'name': 'Nyanga', 'latitude': -18.2, 'longitude': 32.75},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        nyanga = Location.objects.get(name='Nyanga')
+        self.assertEqual(nyanga.grid_cell, grid_cell(-18.2, 32.75))
+        self.assertEqual(self.client.post('/api/locations/', {'name': 'NYANGA'}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(f'/api/locations/{nyanga.id}/', {'latitude': None},
+                                           format='json').status_code, 400)
+
+
+class DashboardStatsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.commercial, self.communal = make_farm_type('Commercial'), make_farm_type('Communal')
+        self.maize, self.tobacco = make_crop('Maize'), make_crop('Tobacco')
+        self.farmer = make_farmer(self.commercial, self.maize, '63-111111A11', location='Harare')
+        make_farmer(self.communal, self.maize, '08-222222B22', location='Bulawayo')
+        CustomUser.objects.create_user(username='clerk', role='clerk')
+
+    def counts(self, rows, key='name'):
+        return {row[key]: row['count'] for row in rows}
+
+    def test_aggregates(self):
+        data = self.client.get('/api/stats/').data
+        self.assertEqual(data['totals'], {
+            'farmers': 2, 'farm_types': 2, 'crops': 2, 'users': 1, 'clerks': 1, 'admins': 0,
+        })
+        self.assertEqual(self.counts(data['by_farm_type']), {'Commercial': 1, 'Communal': 1})
+        self.assertEqual(self.counts(data['by_crop']), {'Maize': 2, 'Tobacco': 0})
+        self.assertEqual(self.counts(data['by_location'], 'location'), {'Bulawayo': 1, 'Harare': 1})
+
+    def test_counters_follow_updates_and_deletes(self):
+        self.farmer.crop = self.tobacco
+        self.farmer.location = 'Bulawayo'
+        self.farmer.save()
+        data = self.client.get('/api/stats/').data
+        self.assertEqual(self.counts(data['by_crop']), {'Maize': 1, 'Tobacco': 1})
+        self.assertEqual(self.counts(data['by_location'], 'location'), {'Bulawayo': 2})
+
+        self.communal.delete()  # cascades to its farmer
+        data = self.client.get('/api/stats/').data
+        self.assertEqual(data['totals']['farmers'], 1)
+        self.assertEqual(self.counts(data['by_crop']), {'Maize': 0, 'Tobacco': 1})
+
+    def test_counters_match_rebuild(self):
+        self.client.post('/api/farmers/bulk/', [{
+            'name': 'Bulk', 'national_id': '99-999999Z99', 'location': 'Gweru',
+            'farm_type': self.communal.id, 'crop': self.tobacco.id,
+        }, {
+            # Moves an existing farmer's counters
+            'name': 'Moved', 'national_id': '63-111111A11', 'location': 'Gweru',
+            'farm_type': self.communal.id, 'crop': self.tobacco.id,
+        }], format='json')
+        upload = SimpleUploadedFile('farmers.csv', (
+            "name,national_id,location,farm_type,crop\n"
+            "Imported,55-555555E55,Mutare,Commercial,Maize\n"
+        ).encode(), content_type='text/csv')
+        self.client.post('/api/farmers/import/', {'file': upload})
+
+        before = self.client.get('/api/stats/').data
+        self.assertEqual(self.counts(before['by_location'], 'location'),
+                         {'Bulawayo': 1, 'Gweru': 2, 'Mutare': 1})
+        rebuild_farmer_stats()
+        self.assertEqual(self.client.get('/api/stats/').data, before)
+        self.assertEqual(before['totals']['farmers'], 4)
+
+    def test_bulk_writes_do_not_rescan_registry(self):
+        row = {'name': 'Bulk', 'national_id': '99-999999Z99', 'location': 'Harare',
+               'farm_type': self.communal.id, 'crop': self.tobacco.id}
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/api/farmers/bulk/', [row], format='json')
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'] or 'DELETE' in q['sql']])
+
+    def test_constant_queries(self):
+        with self.assertNumQueries(4):
+            self.client.get('/api/stats/')
+
+
+class FarmerExportTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type, self.crop = make_farm_type(), make_crop()
+        make_farmer(self.farm_type, self.crop, '63-111111A11', 'Tendai, "TM" Moyo', 'Harare')
+        make_farmer(self.farm_type, self.crop, '08-222222B22', 'Rudo Ncube', 'Bulawayo')
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response = self.client.get('/api/farmers/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.content(response).decode())))
+        self.assertEqual([r['name'] for r in rows], ['Tendai, "TM" Moyo', 'Rudo Ncube'])
+        self.assertEqual(rows[0]['farm_type'], 'Commercial')
+        self.assertEqual(rows[0]['crop'], 'Maize')
+
+    def test_ndjson_with_filters(self):
+        response = self.client.get('/api/farmers/export/', {'export_format': 'ndjson', 'location': 'Bulawayo'})
+        lines = self.content(response).decode().splitlines()
+        self.assertEqual([json.loads(line)['national_id'] for line in lines], ['08-222222B22'])
+
+    def test_gzip(self):
+        response = self.client.get('/api/farmers/export/', {'export_format': 'ndjson', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('farmers.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(len(gzip.decompress(self.content(response)).splitlines()), 2)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/farmers/export/', {'export_format': 'xlsx'}).status_code, 400)
+
+
+class FarmerImportTests(BaseTestCase):
+    CSV = (
+        "name,national_id,location,farm_type,crop\n"
+        "Tendai Moyo,63-111111A11,Harare,commercial,Maize\n"
+        "Rudo Ncube,08-222222B22,,Communal,maize\n"
+        "Bad Crop,08-333333C33,Gweru,Commercial,Coffee\n"
+        "Existing,42-000000Z42,Gweru,Commercial,Maize\n"
+        "Twice,08-222222B22,Gweru,Commercial,Maize\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.commercial, self.communal = make_farm_type('Commercial'), make_farm_type('Communal')
+        self.maize = make_crop('Maize')
+        make_farmer(self.commercial, self.maize, '42-000000Z42', 'Already Here')
+
+    def test_command_imports_and_writes_rejects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'district.csv')
+            with open(path, 'w') as f:
+                f.write(self.CSV)
+            out = io.StringIO()
+            call_command('import_farmers', path, '--batch-size', '2', stdout=out)
+            with open(path + '.rejected.csv') as f:
+                rejects = list(csv.DictReader(f))
+
+        self.assertIn('Imported 2 new and 0 updated farmers, rejected 3', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertEqual(
+            {r['name']: r['error'] for r in rejects},
+            {
+                'Bad Crop': "unknown crop 'Coffee'",
+                'Existing': "national_id already registered",
+                'Twice': "duplicate national_id in file",
+            },
+        )
+        rudo = Farmer.objects.get(national_id='08-222222B22')
+        self.assertEqual((rudo.location, rudo.farm_type, rudo.crop), ('Harare', self.communal, self.maize))
+        self.assertEqual(self.client.get('/api/stats/').data['totals']['farmers'], 3)
+
+    def test_upload_endpoint(self):
+        upload = SimpleUploadedFile('district.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post('/api/farmers/import/', {'file': upload, 'update_existing': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['rejected']), (2, 1, 2))
+        self.assertEqual(response.data['rejected_rows'][0]['error'], "unknown crop 'Coffee'")
+        self.assertEqual(Farmer.objects.get(national_id='42-000000Z42').name, 'Existing')
+
+    def test_upload_requires_columns(self):
+        upload = SimpleUploadedFile('bad.csv', b'name,crop\nX,Maize\n', content_type='text/csv')
+        response = self.client.post('/api/farmers/import/', {'file': upload})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unreadable_row_reports_committed_batches(self):
+        body = (
+            "name,national_id,location,farm_type,crop\n"
+            "Rudo Ncube,08-222222B22,Harare,Communal,Maize\n"
+            f"{'x' * 200000},09-333333C33,Harare,Communal,Maize\n"  # Over csv.field_size_limit()
+        )
+        upload = SimpleUploadedFile('big.csv', body.encode(), content_type='text/csv')
+        response = self.client.post('/api/farmers/import/', {'file': upload, 'batch_size': '1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('after line 2', response.data['detail'])
+        self.assertEqual(response.data['created'], 1)
+        self.assertTrue(Farmer.objects.filter(national_id='08-222222B22').exists())
+
+    def test_rows_lost_to_a_concurrent_insert_are_not_counted(self):
+        bulk_create = Farmer.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Another request registers one of the ids between the check and the insert
+            Farmer.objects.create(name='Someone Else', national_id='08-222222B22',
+                                  farm_type=self.commercial, crop=self.maize)
+            return bulk_create(objs, **kwargs)
+
+        upload = SimpleUploadedFile('district.csv', self.CSV.encode(), content_type='text/csv')
+        with mock.patch.object(Farmer.objects, 'bulk_create', side_effect=racing_bulk_create):
+            response = self.client.post('/api/farmers/import/', {'file': upload, 'batch_size': '100'})
+        self.assertEqual(response.data['created'], 1)
+        self.assertIn('Rudo Ncube', [r['name'] for r in response.data['rejected_rows']])
+        self.assertEqual(Farmer.objects.get(national_id='08-222222B22').name, 'Someone Else')
+
+
+def image_bytes(size=(2000, 1500), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (40, 160, 60)).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def data_uri(data, mime='image/png'):
+    return f"data:{mime};base64," + base64.b64encode(data).decode()
+
+
+class MediaTestCase(BaseTestCase):
+    """Keeps uploaded files in a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.media_root = media.name
+
+
+@override_settings(CROP_IMAGE_ASYNC=False)
+class CropImagePipelineTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def create_crop(self, image):
+        return self.client.post('/api/crops/', {'name': 'Maize', 'description': 'Grain', 'image': image}, format='json')
+
+    def test_upload_generates_webp_variants(self):
+        response = self.create_crop(data_uri(image_bytes()))
+        self.assertEqual(response.status_code, 201)
+        crop = Crop.objects.get()
+        self.assertEqual(crop.image_status, Crop.IMAGE_READY)
+        self.assertEqual(set(crop.image_variants), {'large', 'medium', 'thumb'})
+        with crop.image.storage.open(crop.image_variants['thumb']) as f:
+            thumb = Image.open(f)
+            self.assertEqual((thumb.format, max(thumb.size)), ('WEBP', 160))
+
+        data = self.client.get(f'/api/crops/{crop.id}/').data
+        self.assertTrue(data['image_variants']['thumb'].startswith('http://testserver/media/crops/variants/'))
+        self.assertEqual(data['image_status'], 'ready')
+
+    def test_rejects_non_images(self):
+        self.assertEqual(self.create_crop(data_uri(b'GIF89a not really')).status_code, 400)
+        self.assertEqual(self.create_crop('https://example.com/maize.png').status_code, 400)
+        self.assertFalse(Crop.objects.exists())
+
+    def test_update_replaces_variants(self):
+        self.create_crop(data_uri(image_bytes()))
+        crop = Crop.objects.get()
+        old_thumb = crop.image_variants['thumb']
+        response = self.client.put(f'/api/crops/{crop.id}/', {
+            'name': 'Maize', 'description': 'Grain', 'image': data_uri(image_bytes((300, 200), 'JPEG'), 'image/jpeg'),
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        crop.refresh_from_db()
+        self.assertNotEqual(crop.image_variants['thumb'], old_thumb)
+        self.assertFalse(MediaBlob.objects.filter(name=old_thumb).exists())
+        with crop.image.storage.open(crop.image_variants['large']) as f:
+            self.assertEqual(Image.open(f).size, (300, 200))
+
+    @override_settings(CROP_IMAGE_ASYNC=True)
+    def test_async_processing_goes_through_task_queue(self):
+        response = self.create_crop(data_uri(image_bytes((50, 50))))
+        crop = Crop.objects.get()
+        self.assertEqual(crop.image_status, Crop.IMAGE_PENDING)
+        job = Task.objects.get()
+        self.assertEqual((job.name, job.args), ('crop_image', [crop.id]))
+        self.assertEqual(response.data['image_task'], job.id)
+        self.assertEqual(self.client.get(f"/api/tasks/{response.data['image_task']}/").data['status'], 'queued')
+
+        self.assertEqual(run_due_tasks(), 1)
+        crop.refresh_from_db()
+        self.assertEqual(crop.image_status, Crop.IMAGE_READY)
+
+    def test_pending_status_reaches_cached_list(self):
+        self.create_crop(data_uri(image_bytes((50, 50))))
+        crop = Crop.objects.get()
+        self.assertEqual(self.client.get('/api/crops/').data[0]['image_status'], 'ready')  # Now cached
+        cursor = self.client.get('/api/sync/').data['cursor']
+        with self.settings(CROP_IMAGE_ASYNC=True):
+            schedule_crop_image(crop)  # Re-queued without a new upload
+        self.assertEqual(self.client.get('/api/crops/').data[0]['image_status'], 'pending')
+        changed = self.client.get('/api/sync/', {'since': cursor}).data['crops']['updated']
+        self.assertEqual([c['image_status'] for c in changed], ['pending'])
+
+
+@override_settings(CROP_IMAGE_ASYNC=False)
+class CropBinaryUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_multipart_create(self):
+        upload = SimpleUploadedFile('maize.jpg', image_bytes((64, 48), 'JPEG'), content_type='image/jpeg')
+        response = self.client.post('/api/crops/', {'name': 'Maize', 'description': 'Grain', 'image': upload})
+        self.assertEqual(response.status_code, 201)
+        crop = Crop.objects.get()
+        self.assertTrue(crop.image.name.endswith('.jpg'))
+        self.assertEqual(crop.image_status, Crop.IMAGE_READY)
+
+    def test_raw_body_upload(self):
+        crop = make_crop()
+        response = self.client.put(
+            f'/api/crops/{crop.id}/image/', image_bytes((32, 32), 'WEBP'), content_type='image/webp'
+        )
+        self.assertEqual(response.status_code, 200)
+        crop.refresh_from_db()
+        self.assertTrue(crop.image.name.endswith('.webp'))
+        self.assertIn('thumb', response.data['image_variants'])
+        self.assertIsNone(response.data['image_task'])  # Processed inline
+
+    @override_settings(CROP_IMAGE_ASYNC=True)
+    def test_raw_body_upload_returns_task(self):
+        crop = make_crop()
+        response = self.client.put(
+            f'/api/crops/{crop.id}/image/', image_bytes((32, 32), 'WEBP'), content_type='image/webp'
+        )
+        self.assertEqual(response.data['image_status'], 'pending')
+        self.assertEqual(response.data['image_task'], Task.objects.get(args=[crop.id]).id)
+
+    def test_content_is_sniffed_not_trusted(self):
+        crop = make_crop()
+        response = self.client.put(f'/api/crops/{crop.id}/image/', b'<svg></svg>', content_type='image/png')
+        self.assertEqual(response.status_code, 400)
+        upload = SimpleUploadedFile('x.png', b'%PDF-1.4', content_type='image/png')
+        response = self.client.post('/api/crops/', {'name': 'Maize', 'description': 'Grain', 'image': upload})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CROP_IMAGE_MAX_BYTES=1024)
+    def test_size_limit(self):
+        big = image_bytes((400, 400), 'PNG')
+        crop = make_crop()
+        response = self.client.put(f'/api/crops/{crop.id}/image/', big, content_type='image/png')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('larger than', response.data['image'][0])
+        response = self.create_legacy(data_uri(big))
+        self.assertEqual(response.status_code, 400)
+
+    def test_base64_still_accepted(self):
+        self.assertEqual(self.create_legacy(data_uri(image_bytes((20, 20)))).status_code, 201)
+
+    def test_mime_wrapped_base64(self):
+        # Noise doesn't compress, so the payload spans several decode slices
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(buffer, 'PNG')
+        payload = base64.encodebytes(buffer.getvalue()).decode()  # 76-character lines
+        self.assertGreater(len(payload), 2 * images.DECODE_CHUNK)
+        decoded = images.decode_data_uri('data:image/png;base64,' + payload)
+        self.assertEqual(decoded.read(), buffer.getvalue())
+        self.assertEqual(self.create_legacy('data:image/png;base64,' + payload).status_code, 201)
+        with self.assertRaises(images.InvalidImage):
+            images.decode_data_uri('data:image/png;base64,' + payload[:-3])
+
+    def create_legacy(self, image):
+        return self.client.post('/api/crops/', {'name': 'Maize', 'description': 'Grain', 'image': image}, format='json')
+
+
+@override_settings(CROP_IMAGE_ASYNC=False)
+class ContentAddressedMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.photo = image_bytes((64, 48))
+
+    def upload(self, crop, data=None):
+        response = self.client.put(f'/api/crops/{crop.id}/image/', data or self.photo, content_type='image/png')
+        self.assertEqual(response.status_code, 200)
+        crop.refresh_from_db()
+        return crop.image.name
+
+    def test_identical_uploads_are_stored_once(self):
+        first, second = make_crop('Maize'), make_crop('Wheat')
+        name = self.upload(first)
+        self.assertEqual(self.upload(second), name)
+        self.assertRegex(name, r'^crops/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(os.path.join(self.media_root, name)))), 1)
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first, second = make_crop('Maize'), make_crop('Wheat')
+        name = self.upload(first)
+        self.upload(second)
+        path = os.path.join(self.media_root, name)
+        thumb = first.image_variants['thumb']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, thumb)))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replacing_an_image_releases_the_old_one(self):
+        crop = make_crop()
+        old = self.upload(crop)
+        with self.captureOnCommitCallbacks(execute=True):
+            new = self.upload(crop, image_bytes((32, 32)))
+        self.assertNotEqual(old, new)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, old)))
+        # Uploading the current image again keeps a single reference
+        self.upload(crop, image_bytes((32, 32)))
+        self.assertEqual(MediaBlob.objects.get(name=new).refcount, 1)
+
+    def test_immutable_caching(self):
+        name = self.upload(make_crop())
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.photo)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        etag = response['ETag']
+        self.assertIn(os.path.basename(name).split('.')[0], etag)
+
+        response = self.client.get(f'/media/{name}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        name = self.upload(make_crop())
+        size = len(self.photo)
+        response = self.client.get(f'/media/{name}', HTTP_RANGE='bytes=0-9', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.photo[:10])
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        response = self.client.get(f'/media/{name}', HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.photo[-5:])
+        response = self.client.get(f'/media/{name}', HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        # A stale If-Range gets the whole file
+        response = self.client.get(f'/media/{name}', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_legacy_files_and_bad_paths(self):
+        os.makedirs(os.path.join(self.media_root, 'crops'))
+        with open(os.path.join(self.media_root, 'crops', 'old.png'), 'wb') as f:
+            f.write(self.photo)
+        response = self.client.get('/media/crops/old.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/crops/missing.png').status_code, 404)
+
+        crop = make_crop()
+        Crop.objects.filter(pk=crop.pk).update(image='crops/old.png')
+        crop.refresh_from_db()
+        crop.delete()
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'crops', 'old.png')))
+
+
+class ConditionalGetTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.crop = make_crop()
+        self.farm_type = make_farm_type()
+
+    def test_not_modified_until_table_changes(self):
+        for url in ('/api/crops/', f'/api/crops/{self.crop.id}/', '/api/farm-types/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            self.assertIn('Last-Modified', response)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+        etag = self.client.get('/api/crops/')['ETag']
+        make_crop('Tobacco')
+        self.assertEqual(self.client.get('/api/crops/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_delete_changes_version(self):
+        etag = self.client.get('/api/farm-types/')['ETag']
+        self.farm_type.delete()
+        self.assertEqual(self.client.get('/api/farm-types/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        plain = self.client.get('/api/crops/')['ETag']
+        paged = self.client.get('/api/crops/', {'page_size': 1})['ETag']
+        self.assertNotEqual(plain, paged)
+
+    def test_etag_never_outruns_cached_body(self):
+        url = f'/api/crops/{self.crop.id}/'
+        etag = self.client.get(url)['ETag']
+        # Changed by another process: this one's cached body is out of date
+        Crop.objects.filter(pk=self.crop.pk).update(name='Sorghum')
+        SyncChange.objects.create(model='crop', object_id=self.crop.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['name']), (200, 'Sorghum'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_other_tables_do_not_invalidate(self):
+        etag = self.client.get('/api/crops/')['ETag']
+        make_farm_type('Communal')
+        self.assertEqual(self.client.get('/api/crops/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ResponseCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type, self.crop = make_farm_type(), make_crop()
+        self.farmer = make_farmer(self.farm_type, self.crop)
+
+    def test_hit_skips_database(self):
+        self.client.get('/api/farmers/', {'location': 'Harare'})
+        with self.assertNumQueries(1):  # The table versions
+            response = self.client.get('/api/farmers/', {'location': 'Harare'})
+        self.assertEqual(response.data[0]['name'], 'Tendai Moyo')
+        # A different query string is its own entry
+        self.assertEqual(self.client.get('/api/farmers/', {'location': 'Gweru'}).data, [])
+        self.assertEqual(self.client.get('/api/cache-stats/').data['farmers'], {'hits': 1, 'misses': 2, 'ttl': 60})
+
+    def test_model_signals_evict(self):
+        self.client.get(f'/api/farmers/{self.farmer.id}/')
+        self.farm_type.name = 'Smallholder'
+        self.farm_type.save()  # nested in the farmer payload
+        response = self.client.get(f'/api/farmers/{self.farmer.id}/')
+        self.assertEqual(response.data['farm_type']['name'], 'Smallholder')
+
+        self.client.get('/api/crops/')
+        make_crop('Tobacco')
+        self.assertEqual(len(self.client.get('/api/crops/').data), 2)
+
+    def test_bulk_writes_evict(self):
+        self.client.get('/api/farmers/')
+        self.client.post('/api/farmers/bulk/', [{
+            'name': 'Bulk', 'national_id': '99-999999Z99', 'farm_type': self.farm_type.id, 'crop': self.crop.id,
+        }], format='json')
+        self.assertEqual(len(self.client.get('/api/farmers/').data), 2)
+
+    def test_writes_from_other_processes_evict(self):
+        self.client.get('/api/crops/')
+        # A task worker's write: logged, but no signal runs in this process
+        Crop.objects.filter(pk=self.crop.pk).update(name='Sorghum')
+        SyncChange.objects.create(model='crop', object_id=self.crop.pk)
+        self.assertEqual(self.client.get('/api/crops/').data[0]['name'], 'Sorghum')
+
+    def test_location_edits_evict_farmer_lists(self):
+        harare = Location.objects.get(name='Harare')
+        bbox = {'bbox': '30,-18,32,-17'}
+        self.assertEqual(len(self.client.get('/api/farmers/', bbox).data), 1)
+        harare.latitude = -20.0
+        harare.save()
+        self.assertEqual(self.client.get('/api/farmers/', bbox).data, [])
+
+    @override_settings(API_CACHE_ENABLED=False)
+    def test_can_be_disabled(self):
+        self.client.get('/api/crops/')
+        self.assertEqual(self.client.get('/api/cache-stats/').data, {})
+
+
+class DatabaseProfileTests(BaseTestCase):
+    def test_production_sqlite_options_apply_on_connect(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            settings_dict = {
+                **connection.settings_dict,
+                'NAME': os.path.join(tmp, 'prod.sqlite3'),
+                'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS,
+                'CONN_MAX_AGE': 600,
+                'CONN_HEALTH_CHECKS': True,
+            }
+            wrapper = DatabaseWrapper(settings_dict, alias='production-check')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+                self.assertEqual(pragmas['journal_mode'], 'wal')
+                self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+                self.assertEqual(pragmas['busy_timeout'], 5000)
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+
+
+class AsyncEndpointTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = AsyncClient()
+        self.farm_type, self.crop = make_farm_type(), make_crop()
+        self.farmers = [
+            make_farmer(self.farm_type, self.crop, f'{i:02d}-000000A00', f'Farmer {i}', 'Harare' if i % 2 else 'Gweru')
+            for i in range(5)
+        ]
+
+    async def test_lists_match_sync_endpoints(self):
+        for path in ('farmers/', 'crops/', 'farm-types/', f'farmers/{self.farmers[0].id}/', 'stats/'):
+            response = await self.client.get(f'/api/async/{path}')
+            self.assertEqual(response.status_code, 200, path)
+            sync_response = await sync_to_async(APIClient().get)(f'/api/{path}')
+            self.assertEqual(response.json(), json.loads(sync_response.content), path)
+
+    async def test_filters_and_keyset_pages(self):
+        response = await self.client.get('/api/async/farmers/', {'location': 'Harare', 'page_size': 1})
+        data = response.json()
+        self.assertEqual([f['name'] for f in data['results']], ['Farmer 1'])
+        response = await self.client.get('/api/async/farmers/', {
+            'location': 'Harare', 'page_size': 1, 'after': data['next_after'],
+        })
+        data = response.json()
+        self.assertIsNone(data['next_after'])
+        self.assertEqual([f['name'] for f in data['results']], ['Farmer 3'])
+
+    async def test_errors(self):
+        self.assertEqual((await self.client.get('/api/async/farmers/999999/')).status_code, 404)
+        self.assertEqual((await self.client.get('/api/async/farmers/', {'crop': 'x'})).status_code, 400)
+        self.assertEqual((await self.client.post('/api/async/farmers/')).status_code, 405)
+
+    async def test_current_user_with_jwt(self):
+        user = await CustomUser.objects.acreate(username='clerk', email='clerk@example.com', role='clerk')
+        token = str(AccessToken.for_user(user))
+        response = await self.client.get('/api/async/current-user/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.json()['username'], 'clerk')
+        response = await self.client.get('/api/async/current-user/', headers={'Authorization': 'Bearer junk'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await self.client.get('/api/async/current-user/')).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StatelessJWTTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        clear_token_cache()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            username='rudo', password='s3cret-pass', email='rudo@example.com',
+            first_name='Rudo', last_name='Ncube', role='clerk',
+        )
+
+    def login(self):
+        response = self.client.post('/api/token/', {'username': 'rudo', 'password': 's3cret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_login_returns_profile_and_claims(self):
+        data = self.login()
+        self.assertEqual(data['user'], {
+            'id': self.user.id, 'username': 'rudo', 'email': 'rudo@example.com', 'first_name': 'Rudo',
+            'last_name': 'Ncube', 'is_staff': False, 'role': 'clerk',
+        })
+        claims = AccessToken(data['access'])
+        self.assertEqual((claims['role'], claims['first_name']), ('clerk', 'Rudo'))
+
+    def test_bad_credentials(self):
+        response = self.client.post('/api/token/', {'username': 'rudo', 'password': 'nope'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_authenticated_requests_make_no_auth_queries(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/current-user/')
+        self.assertEqual(response.data['username'], 'rudo')
+        self.assertEqual(response.data['last_name'], 'Ncube')
+
+    def test_refreshed_access_token_keeps_claims(self):
+        refresh = self.login()['refresh']
+        access = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').data['access']
+        self.assertEqual(AccessToken(access)['role'], 'clerk')
+
+    def test_tokens_without_claims_fall_back_to_database(self):
+        access = str(AccessToken.for_user(self.user))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/current-user/')
+        self.assertEqual(response.data['email'], 'rudo@example.com')
+
+    def test_validated_tokens_are_cached(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.client.post('/api/current-user/')
+        with mock.patch('rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token') as validate:
+            self.client.post('/api/current-user/')
+        validate.assert_not_called()
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(self.client.post('/api/current-user/').status_code, 401)
+
+    def test_change_password_still_uses_database_user(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.post('/api/change-password/', {
+            'old_password': 's3cret-pass', 'new_password': 'n3w-s3cret-pass',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-s3cret-pass'))
+
+
+class TokenBlacklistTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='rudo')
+        self.user.set_password('s3cret-pass')
+        self.user.save()
+
+    def login(self):
+        return self.client.post('/api/token/', {'username': 'rudo', 'password': 's3cret-pass'}, format='json').data
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': token}, format='json')
+
+    def logout(self, tokens):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        return self.client.post('/api/logout/', {'refresh': tokens['refresh']}, format='json')
+
+    def test_logged_out_refresh_token_is_rejected(self):
+        tokens = self.login()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 200)
+        self.assertEqual(self.logout(tokens).status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_logout_writes_blacklist_rows_without_queueing_the_token(self):
+        tokens = self.login()
+        self.assertEqual(self.logout(tokens).status_code, 200)
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(BlacklistedToken.objects.get().token.jti, RefreshToken(tokens['refresh'], verify=False)['jti'])
+        # A fresh process loads it from the database
+        blacklisted.clear()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_refresh_does_not_query_blacklist(self):
+        tokens = self.login()
+        self.refresh(tokens['refresh'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh(tokens['refresh']).status_code, 200)
+        self.assertFalse([q for q in queries if 'token_blacklist' in q['sql']])
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_blacklist_from_other_process_is_picked_up(self):
+        tokens = self.login()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 200)
+        # Blacklisted elsewhere: straight into the table, bypassing this process's cache
+        RefreshToken(tokens['refresh']).blacklist()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_late_committed_lower_id_is_picked_up(self):
+        early, late = RefreshToken(self.login()['refresh']), RefreshToken(self.login()['refresh'])
+        late.blacklist()
+        self.assertEqual(self.refresh(str(early)).status_code, 200)
+        # A transaction that took its id before `late` but committed after the sync
+        BlacklistedToken.objects.create(
+            id=BlacklistedToken.objects.get().id - 1, token=OutstandingToken.objects.get(jti=early['jti'])
+        )
+        self.assertEqual(self.refresh(str(early)).status_code, 401)
+
+    def test_cache_loads_existing_blacklist(self):
+        tokens = self.login()
+        RefreshToken(tokens['refresh']).blacklist()
+        blacklisted.clear()
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_prune_tokens_removes_only_expired(self):
+        live = RefreshToken(self.login()['refresh'])
+        expired = RefreshToken(self.login()['refresh'])
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+        out = io.StringIO()
+        call_command('prune_tokens', batch_size=1, stdout=out)
+        self.assertIn('Pruned 1 expired tokens', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+@override_settings(PASSWORD_REHASH_ASYNC=False)
+class PasswordHashingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='rudo')
+        self.user.password = make_password('s3cret-pass', hasher='pbkdf2_sha256')
+        self.user.save()
+
+    def login(self):
+        return self.client.post('/api/token/', {'username': 'rudo', 'password': 's3cret-pass'}, format='json')
+
+    def test_new_hashes_use_tuned_argon2(self):
+        self.user.set_password('n3w-s3cret-pass')
+        self.assertTrue(self.user.password.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+
+    def test_login_upgrades_outdated_hash(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertTrue(self.user.check_password('s3cret-pass'))
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_REHASH_ASYNC=True)
+    def test_rehash_runs_after_commit_in_background(self):
+        with mock.patch('main.hashers._get_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.login().status_code, 200)
+        old_encoded = self.user.password
+        executor.return_value.submit.assert_called_once_with(
+            hashers._run_in_worker, self.user.pk, old_encoded, 's3cret-pass'
+        )
+        hashers._pending.clear()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old_encoded)
+
+    def test_rehash_never_overwrites_changed_password(self):
+        old_encoded = self.user.password
+        self.user.set_password('n3w-s3cret-pass')
+        self.user.save()
+        hashers.rehash_password(self.user.pk, old_encoded, 's3cret-pass')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-s3cret-pass'))
+
+    @override_settings(PASSWORD_HASH_WAIT=0)
+    def test_login_gets_503_when_hashing_slots_are_busy(self):
+        with hashers.hashing_slot(), hashers.hashing_slot():
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASH_CONCURRENCY=1, PASSWORD_HASH_WAIT=0)
+    def test_inline_rehash_reuses_the_login_slot(self):
+        with mock.patch.object(hashers, '_slots', None):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('argon2$'))
+            # The slot was handed back
+            self.assertEqual(self.login().status_code, 200)
+
+
+class MetricsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+        self.client = APIClient()
+        make_farmer(make_farm_type(), make_crop())
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_requests_latency_queries_and_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/farmers/')
+        query_count = len(queries)  # read now, the next request resets the query log
+        self.client.get('/api/farmers/')
+        text = self.scrape()
+        self.assertIn('http_requests_total{route="farmer-list",method="GET",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{route="farmer-list",method="GET"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="farmer-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('http_response_size_bytes_count{route="farmer-list",method="GET"} 2', text)
+        # The second request is served from the response cache after reading the table versions
+        self.assertIn(f'db_queries_per_request_sum{{route="farmer-list",method="GET"}} {query_count + 1}', text)
+        self.assertIn('db_query_duration_seconds_total{route="farmer-list",method="GET"}', text)
+        self.assertGreater(len(response.content), 0)
+        self.assertNotIn('route="metrics"', text)
+
+    def test_unmatched_routes_share_one_label(self):
+        self.client.get('/no/such/page/')
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', self.scrape())
+
+    async def test_async_views_are_counted(self):
+        await AsyncClient().get('/api/async/farmers/')
+        text = await sync_to_async(self.scrape)()
+        self.assertIn('http_requests_total{route="async_farmer_list",method="GET",status="200"} 1', text)
+        self.assertNotIn('db_queries_per_request_sum{route="async_farmer_list",method="GET"} 0', text)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_token_protects_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_STACK_SAMPLE_RATE=1)
+    def test_slow_query_log_with_stack(self):
+        with self.assertLogs('main.slow_queries', 'WARNING') as logs:
+            self.client.get('/api/farmers/')
+        self.assertTrue(any('FROM "main_farmer"' in line for line in logs.output))
+        self.assertIn('File "', logs.output[0])
+
+    def test_slow_query_log_off_by_default(self):
+        with self.assertNoLogs('main.slow_queries'):
+            self.client.get('/api/farmers/')
+
+
+class SparseFieldsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type, self.crop = make_farm_type(), make_crop()
+        self.farmers = [
+            make_farmer(self.farm_type, self.crop, f'{i:02d}-000000A00', f'Farmer {i}') for i in range(3)
+        ]
+
+    def test_fields_limits_payload(self):
+        response = self.client.get('/api/farmers/', {'fields': 'id,name'})
+        self.assertEqual(response.data[0], {'id': self.farmers[0].id, 'name': 'Farmer 0'})
+        response = self.client.get(f'/api/crops/{self.crop.id}/', {'fields': 'name'})
+        self.assertEqual(response.data, {'name': 'Maize'})
+
+    def test_nested_serializers_keep_their_fields(self):
+        response = self.client.get('/api/farmers/', {'fields': 'name,farm_type'})
+        self.assertEqual(set(response.data[0]['farm_type']), {'id', 'name', 'description', 'updated_at'})
+
+    def test_expand_nests_crop(self):
+        self.assertEqual(self.client.get('/api/farmers/').data[0]['crop'], self.crop.id)
+        crop = self.client.get('/api/farmers/', {'expand': 'crop'}).data[0]['crop']
+        self.assertEqual((crop['id'], crop['name']), (self.crop.id, 'Maize'))
+
+    def test_users_never_send_password_and_defer_groups(self):
+        user = CustomUser.objects.create_user(username='rudo', password='s3cret-pass')
+        user.groups.add(Group.objects.create(name='clerks'))
+        data = self.client.get(f'/api/users/{user.id}/').data
+        self.assertNotIn('password', data)
+        self.assertNotIn('groups', data)
+        data = self.client.get(f'/api/users/{user.id}/', {'expand': 'groups'}).data
+        self.assertEqual(len(data['groups']), 1)
+        self.assertNotIn('user_permissions', data)
+
+    def test_writes_still_accept_deferred_fields(self):
+        group = Group.objects.create(name='clerks')
+        response = self.client.post('/api/users/', {
+            'username': 'farai', 'password': 'n3w-s3cret-pass', 'groups': [group.id],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('password', response.data)
+        self.assertEqual(list(CustomUser.objects.get(username='farai').groups.all()), [group])
+
+    def test_compact_list(self):
+        response = self.client.get('/api/farmers/', {'compact': '1'})
+        self.assertEqual(response.data['columns'][:3], ['id', 'name', 'national_id'])
+        self.assertEqual(len(response.data['results']), 3)
+        row = dict(zip(response.data['columns'], response.data['results'][0]))
+        self.assertEqual(row['farm_type_name'], 'Commercial')
+        self.assertEqual(row['crop'], self.crop.id)
+
+    def test_compact_with_fields_filters_and_pages(self):
+        response = self.client.get('/api/farmers/', {'compact': '1', 'fields': 'name,location', 'page_size': 2})
+        self.assertEqual(response.data['columns'], ['name', 'location'])
+        self.assertEqual(response.data['results'], [['Farmer 0', 'Harare'], ['Farmer 1', 'Harare']])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [['Farmer 2', 'Harare']])
+        response = self.client.get('/api/farmers/', {'compact': '1', 'fields': 'name', 'search': 'Farmer 1'})
+        self.assertEqual(response.data['results'], [['Farmer 1']])
+
+    def test_compact_is_one_row_query(self):
+        with self.assertNumQueries(2):  # The response cache's table versions, then the rows
+            self.client.get('/api/farmers/', {'compact': '1'})
+
+
+class CompressionTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.farm_type, self.crop = make_farm_type(), make_crop()
+        for i in range(30):
+            make_farmer(self.farm_type, self.crop, f'{i:02d}-000000A00', f'Farmer {i}')
+
+    def test_gzip_negotiation(self):
+        plain = self.client.get('/api/farmers/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get('/api/farmers/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        response = self.client.get('/api/farmers/', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_negotiation(self):
+        plain = self.client.get('/api/farmers/')
+        response = self.client.get('/api/farmers/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_small_responses_left_alone(self):
+        response = self.client.get(f'/api/farm-types/{self.farm_type.id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compressed_etag_is_weak_and_still_validates(self):
+        for i in range(20):
+            make_crop(f'Crop {i}')
+        response = self.client.get('/api/crops/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get('/api/crops/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_export_streams_compressed_but_gzip_export_is_not_recompressed(self):
+        response = self.client.get('/api/farmers/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Farmer 29', gzip.decompress(b''.join(response.streaming_content)))
+
+        response = self.client.get('/api/farmers/export/', {'gzip': '1'}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'Farmer 29', gzip.decompress(b''.join(response.streaming_content)))
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_messagepack_round_trip(self):
+        response = self.client.get('/api/farmers/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get('/api/farmers/').json())
+
+        body = msgpack.packb({
+            'name': 'Packed Farmer', 'national_id': '77-000000P77', 'location': 'Gweru',
+            'farm_type': self.farm_type.id, 'crop': self.crop.id,
+        })
+        response = self.client.post('/api/farmers/', body, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['name'], 'Packed Farmer')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_malformed_messagepack_is_400(self):
+        response = self.client.post('/api/farmers/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+
+calls = []
+
+
+@task('tests.flaky', max_attempts=2, retry_delay=60)
+def flaky(value, fail=True):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+    return {'echo': value}
+
+
+class TaskQueueTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def make_due(self):
+        Task.objects.update(run_after=timezone.now())
+
+    def test_runs_task_and_stores_result(self):
+        job = enqueue('tests.flaky', 'hi', fail=False)
+        self.assertEqual(run_due_tasks(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (Task.DONE, 1, {'echo': 'hi'}))
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_retries_with_backoff_then_fails(self):
+        job = enqueue('tests.flaky', 'x')
+        with self.assertLogs('main.tasks', 'ERROR'):
+            run_due_tasks()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(run_due_tasks(), 0)  # not due yet
+
+        self.make_due()
+        with self.assertLogs('main.tasks', 'ERROR'):
+            run_due_tasks()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+        self.assertEqual(job.last_error, 'RuntimeError: boom')
+        self.assertEqual(calls, ['x', 'x'])
+
+    def test_expired_lease_is_picked_up_again(self):
+        job = enqueue('tests.flaky', 'y', fail=False)
+        Task.objects.filter(id=job.id).update(
+            status=Task.RUNNING, attempts=1, locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(run_due_tasks(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.DONE, 2))
+
+    def test_lost_task_out_of_attempts_fails(self):
+        job = enqueue('tests.flaky', 'z', fail=False)
+        Task.objects.filter(id=job.id).update(
+            status=Task.RUNNING, attempts=2, locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(run_due_tasks(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Task.FAILED)
+        self.assertEqual(calls, [])
+
+    def test_status_endpoint(self):
+        job = enqueue('tests.flaky', 'hi', fail=False)
+        client = APIClient()
+        self.assertEqual(client.get(f'/api/tasks/{job.id}/').data['status'], 'queued')
+        run_due_tasks()
+        data = client.get(f'/api/tasks/{job.id}/').data
+        self.assertEqual((data['status'], data['result'], data['error']), ('done', {'echo': 'hi'}, None))
+        self.assertEqual(client.get('/api/tasks/999999/').status_code, 404)
+
+    def test_unknown_task_names_are_rejected(self):
+        with self.assertRaises(KeyError):
+            enqueue('tests.nope')
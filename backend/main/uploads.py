@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework.parsers import FileUploadParser
+
+
+def max_image_bytes():
+    return getattr(settings, 'CROP_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+
+
+class CappedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Stream every upload to a temp file, never into memory.
+
+    Bytes past CROP_IMAGE_MAX_BYTES are counted but not written, so an
+    oversized upload costs at most the cap on disk and the reported size still
+    lets validation reject it. Storage moves the temp file into MEDIA_ROOT
+    instead of copying it.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) <= max_image_bytes():
+            self.file.write(raw_data)
+
+
+class RawImageUploadParser(FileUploadParser):
+    """Raw ``image/*`` request body; the filename header is optional."""
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(stream, media_type, parser_context) or 'upload'
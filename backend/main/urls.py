@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FarmTypeViewSet, CropViewSet, FarmerViewSet, UserViewSet , LogoutView ,current_user , CustomTokenObtainPairView , ChangePasswordView ,landing_page
+from . import async_views
+from .metrics import metrics_view
+from .views import FarmTypeViewSet, CropViewSet, FarmerViewSet, LocationViewSet, UserViewSet , LogoutView ,current_user , CustomTokenObtainPairView , ChangePasswordView ,landing_page, sync, stats, api_cache_stats, task_detail
 
 router = DefaultRouter()
 router.register(r'farm-types', FarmTypeViewSet)
 router.register(r'crops', CropViewSet)
 router.register(r'farmers', FarmerViewSet)
+router.register(r'locations', LocationViewSet)
 router.register(r'users', UserViewSet)
 
 urlpatterns = [
@@ -14,5 +17,18 @@ urlpatterns = [
     path('api/current-user/', current_user, name='current_user'),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/change-password/', ChangePasswordView.as_view(), name='change-password'),
+    path('api/sync/', sync, name='sync'),
+    path('api/stats/', stats, name='stats'),
+    path('api/cache-stats/', api_cache_stats, name='cache_stats'),
+    path('api/tasks/<int:pk>/', task_detail, name='task_detail'),
+    path('api/async/farmers/', async_views.farmer_list, name='async_farmer_list'),
+    path('api/async/farmers/<int:pk>/', async_views.farmer_detail, name='async_farmer_detail'),
+    path('api/async/crops/', async_views.crop_list, name='async_crop_list'),
+    path('api/async/crops/<int:pk>/', async_views.crop_detail, name='async_crop_detail'),
+    path('api/async/farm-types/', async_views.farm_type_list, name='async_farm_type_list'),
+    path('api/async/farm-types/<int:pk>/', async_views.farm_type_detail, name='async_farm_type_detail'),
+    path('api/async/stats/', async_views.stats, name='async_stats'),
+    path('api/async/current-user/', async_views.current_user, name='async_current_user'),
+    path('metrics', metrics_view, name='metrics'),
     path('', landing_page, name='landing_page'),
 ]
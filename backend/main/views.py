@@ -1,22 +1,24 @@
 from rest_framework import viewsets
-from .models import Crop, Farmer, FarmType, CustomUser
+from .models import Crop, Farmer, FarmType, CustomUser, Location, Task
 from .serializers import (
     CropGetSerializer, CropPostSerializer,
     FarmerGetSerializer, FarmerPostSerializer,
     FarmTypeGetSerializer,
-    UserGetSerializer
+    LocationSerializer,
+    UserGetSerializer,
+    CustomTokenObtainPairSerializer
 )
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import NotFound
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.response import Response
 from rest_framework import status
@@ -24,47 +26,56 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+import io
+from .importer import FarmerImporter, ImportAborted
+from .uploads import CappedTemporaryFileUploadHandler, RawImageUploadParser, max_image_bytes
+from .images import InvalidImage, prepare_upload, replace_crop_image, schedule_crop_image
+from rest_framework.parsers import MultiPartParser
+from .export import EXPORT_FORMATS, export_stream
+from .filters import filter_farmers
+from .duplicates import find_similar_farmers
+from .locations import bbox_query, nearest_locations, parse_bbox, with_farmer_counts
+from .sparse import CompactListMixin
+from .tasks import task_status
+from .conditional import ConditionalGetMixin
+from .authentication import user_role
+from .hashers import hashing_slot
+from .blacklist import CachedBlacklistRefreshToken
+from .cache import CachedResponseMixin, cache_stats
+from .bulk import bulk_max_rows, bulk_upsert_farmers
+from .stats import dashboard_stats
+from .sync import DEFAULT_SYNC_LIMIT, MAX_SYNC_LIMIT, changes_since, full_snapshot
 
 def landing_page(request):
     return render(request, 'index.html')
 class CustomTokenObtainPairView(TokenObtainPairView):
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-
-        # Retrieve the token pair from the response
-        access_token = response.data.get('access')
-        refresh_token = response.data.get('refresh')
+    serializer_class = CustomTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
         try:
-            # Decode the access token to get user info using AccessToken
-            decoded = AccessToken(access_token).payload  # Use AccessToken for the access token
-            user = CustomUser.objects.get(id=decoded['user_id'])  # Fetch user based on the decoded ID
-
-            # Add user info to the response
-            # Add user info to the response
-            role = getattr(user, 'role', None)
-
-            # If the role is None, determine it based on whether the user is a superuser
-            if role is None:
-                role = 'admin' if user.is_superuser else 'clerk'
-                            
-            response.data['user'] = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'is_staff': user.is_staff,
-                'role': role 
-            }
-
-            return response
-        except InvalidToken:
-            return Response(
-                {"detail": "Token is invalid or expired."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            # Checking the password is the expensive part of a login
+            with hashing_slot():
+                serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
 
+        # The serializer already loaded the user to check the password, so the
+        # profile comes from there instead of decoding the new token and
+        # querying CustomUser again
+        user = serializer.user
+        data = dict(serializer.validated_data)
+        data['user'] = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'is_staff': user.is_staff,
+            'role': user_role(user)
+        }
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class LogoutView(APIView):
@@ -72,9 +83,11 @@ class LogoutView(APIView):
 
     def post(self, request):
         try:
-            # Blacklist the refresh token to invalidate the token
+            # Blacklist the refresh token to invalidate the token. Written
+            # inline: a queued job would keep the raw token in the task table
+            # and other workers would accept it until a queue worker ran.
             refresh_token = request.data.get('refresh')
-            token = RefreshToken(refresh_token)
+            token = CachedBlacklistRefreshToken(refresh_token)
             token.blacklist()
 
             return Response({"detail": "Successfully logged out."}, status=200)
@@ -82,24 +95,199 @@ class LogoutView(APIView):
             return Response({"detail": "Failed to log out."}, status=400)
 
 
-class CropViewSet(viewsets.ModelViewSet):
+class CropViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Crop.objects.all()
+    cache_endpoint = 'crops'
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Uploaded images go straight to a capped temp file, never into memory
+        request.upload_handlers = [CappedTemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
     def get_serializer_class(self):
         if self.request.method == "GET":
             return CropGetSerializer
         return CropPostSerializer
 
-class FarmerViewSet(viewsets.ModelViewSet):
-    queryset = Farmer.objects.all()
+    @action(detail=True, methods=['put', 'post'], url_path='image',
+            parser_classes=[RawImageUploadParser, MultiPartParser])
+    def image(self, request, pk=None):
+        # Replace the image with a raw image/* body or a multipart 'image' file
+        crop = self.get_object()
+        upload = request.FILES.get('file') or request.FILES.get('image')
+        if upload is None:
+            return Response({"detail": "No image uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            image = prepare_upload(upload, limit=max_image_bytes())
+            replace_crop_image(crop, image)
+        except InvalidImage as e:
+            return Response({"image": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            # DRF keeps raw-body uploads out of request.FILES, so Django won't close them
+            upload.close()
+
+        job = schedule_crop_image(crop)
+        crop.refresh_from_db()
+        data = CropGetSerializer(crop, context={'request': request}).data
+        # Poll /api/tasks/<image_task>/ for the variants; null when processed inline
+        return Response({**data, 'image_task': job.pk if job else None})
+
+class FarmerViewSet(CachedResponseMixin, CompactListMixin, viewsets.ModelViewSet):
+    # Join the relations up front so FarmerGetSerializer doesn't query per row
+    queryset = Farmer.objects.select_related('farm_type', 'crop')
+    cache_endpoint = 'farmers'
+    # ?compact=1 columns for the app's table screens
+    compact_fields = {
+        'id': 'id',
+        'name': 'name',
+        'national_id': 'national_id',
+        'location': 'location',
+        'farm_type': 'farm_type_id',
+        'farm_type_name': 'farm_type__name',
+        'crop': 'crop_id',
+        'crop_name': 'crop__name',
+        'updated_at': 'updated_at',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = filter_farmers(queryset, self.request.query_params)
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method == "GET":
             return FarmerGetSerializer
         return FarmerPostSerializer
 
-class FarmTypeViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Upsert a batch of offline-captured registrations keyed on national_id.
+        # Accepts a list of farmers or {"farmers": [...]}.
+        rows = request.data.get('farmers') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list):
+            return Response({"detail": "Expected a list of farmers."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > bulk_max_rows():
+            return Response(
+                {"detail": f"At most {bulk_max_rows()} farmers per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = bulk_upsert_farmers(rows)
+        summary = {state: 0 for state in ('created', 'updated', 'skipped', 'error')}
+        for result in results:
+            summary[result['status']] += 1
+        return Response({**summary, 'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def similar(self, request):
+        # Ranked possible duplicates for ?name= and/or ?national_id=, e.g. while
+        # a clerk is still typing. ?exclude= skips the farmer being edited.
+        params = request.query_params
+        name, national_id = params.get('name', '').strip(), params.get('national_id', '').strip()
+        if not name and not national_id:
+            return Response({"detail": "Pass name and/or national_id."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(params.get('limit', 10)), 1), 50)
+            exclude = int(params['exclude']) if params.get('exclude') else None
+        except ValueError:
+            return Response({"detail": "limit and exclude must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        results = find_similar_farmers(name, national_id, exclude=exclude, limit=limit)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_csv(self, request):
+        # Multipart upload of a CSV in the import_farmers format. Rejected rows
+        # come back in the response (first 1000) instead of a side file.
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "Upload a CSV file in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rejected = []
+
+        def on_reject(row, error):
+            if len(rejected) < 1000:
+                rejected.append({**row, 'error': error})
+
+        try:
+            batch_size = int(request.data.get('batch_size') or 1000)
+        except ValueError:
+            return Response({"detail": "batch_size must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = FarmerImporter(
+            batch_size=max(batch_size, 1),
+            update_existing=request.data.get('update_existing') in ('1', 'true'),
+            on_reject=on_reject,
+        )
+        try:
+            result = importer.run(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except ImportAborted as e:
+            # Batches before the error are committed, say so
+            return Response({**e.result.as_dict(), 'rejected_rows': rejected, 'detail': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**result.as_dict(), 'rejected_rows': rejected}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # Streams the registry as CSV or NDJSON (?export_format=), optionally
+        # gzipped (?gzip=1). Accepts the same filters as the list.
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"detail": f"export_format must be one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+
+        queryset = filter_farmers(Farmer.objects.all(), request.query_params)
+        filename = f"farmers.{export_format}" + (".gz" if gzip else "")
+        response = StreamingHttpResponse(
+            export_stream(queryset, export_format, gzip),
+            content_type='application/gzip' if gzip else EXPORT_FORMATS[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class LocationViewSet(viewsets.ModelViewSet):
+    # Place reference table behind Farmer.location, with per-place farmer
+    # counts for district reports and ?bbox=min_lon,min_lat,max_lon,max_lat
+    # for map views; both are answered from indexes.
+    queryset = Location.objects.order_by('name')
+    serializer_class = LocationSerializer
+
+    def get_queryset(self):
+        queryset = with_farmer_counts(super().get_queryset())
+        bbox = self.request.query_params.get('bbox')
+        if self.action == 'list' and bbox:
+            queryset = queryset.filter(bbox_query(parse_bbox(bbox)))
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        # ?lat=&lon= with optional limit (default 5, max 50) and max_km (default 500)
+        params = request.query_params
+        try:
+            latitude, longitude = float(params['lat']), float(params['lon'])
+            limit = min(max(int(params.get('limit', 5)), 1), 50)
+            max_km = float(params.get('max_km', 500))
+        except (KeyError, ValueError):
+            return Response({"detail": "lat and lon are required numbers; limit and max_km must be numbers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or max_km <= 0:
+            return Response({"detail": "Coordinates out of range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        locations = nearest_locations(latitude, longitude, limit=limit, max_km=max_km)
+        results = LocationSerializer(locations, many=True).data
+        for result, location in zip(results, locations):
+            result['distance_km'] = round(location.distance_km, 2)
+        return Response({'results': results})
+
+
+class FarmTypeViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = FarmType.objects.all()
+    cache_endpoint = 'farm-types'
 
     def get_serializer_class(self):
         if self.request.method == "GET":
@@ -109,6 +297,12 @@ class FarmTypeViewSet(viewsets.ModelViewSet):
 class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Groups and permissions are only sent with ?expand=, prefetch them in bulk then
+        expand = self.request.query_params.get('expand', '').split(',')
+        return queryset.prefetch_related(*[name for name in ('groups', 'user_permissions') if name in expand])
+
     def get_serializer_class(self):
         # Determine serializer class based on the HTTP method
         if self.request.method == "GET":
@@ -120,7 +314,8 @@ class UserViewSet(viewsets.ModelViewSet):
         password = serializer.validated_data.get('password')
         if password:
             user = serializer.save()
-            user.set_password(password)  # Hash the password
+            with hashing_slot():
+                user.set_password(password)  # Hash the password
             user.save()
 
     def perform_update(self, serializer):
@@ -167,12 +362,54 @@ class ChangePasswordView(APIView):
         # Authenticate user using token
         user = request.user
 
-        # Check if the old password is correct
-        if not user.check_password(old_password):
-            raise AuthenticationFailed("Old password is incorrect")
+        with hashing_slot():
+            # Check if the old password is correct
+            if not user.check_password(old_password):
+                raise AuthenticationFailed("Old password is incorrect")
 
-        # Change password
-        user.set_password(new_password)
+            # Change password
+            user.set_password(new_password)
         user.save()
 
         return Response({"detail": "Password successfully updated."}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def sync(request):
+    # Delta sync: ?since=<cursor> returns rows changed after the cursor plus
+    # tombstone ids, and again those changed just before it (see
+    # main.sync.changes_since); no cursor (or 0) returns a full snapshot.
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', DEFAULT_SYNC_LIMIT))
+    except ValueError:
+        return Response({"detail": "since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if since < 0 or limit < 1:
+        return Response({"detail": "since must be >= 0 and limit >= 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+    context = {'request': request}
+    if since == 0:
+        return Response(full_snapshot(context=context))
+    return Response(changes_since(since, min(limit, MAX_SYNC_LIMIT), context=context))
+
+
+@api_view(['GET'])
+def stats(request):
+    # Dashboard counts served from the FarmerStat summary table
+    return Response(dashboard_stats())
+
+
+@api_view(['GET'])
+def task_detail(request, pk):
+    # Status of a queued background task (see main.tasks)
+    job = Task.objects.filter(pk=pk).first()
+    if job is None:
+        raise NotFound("Task not found.")
+    return Response(task_status(job))
+
+
+@api_view(['GET'])
+def api_cache_stats(request):
+    # Per-endpoint hit/miss counters of this worker's response cache
+    return Response(cache_stats())